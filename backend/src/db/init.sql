@@ -24,14 +24,23 @@ CREATE TABLE IF NOT EXISTS rois (
     created_at  TIMESTAMPTZ DEFAULT NOW()
 );
 
--- Tabella eventi rilevati dalla videoanalisi
+-- Tabella eventi rilevati dalla videoanalisi.
+-- Partizionata per mese su timestamp: le query per intervallo di date
+-- leggono solo le partizioni interessate e gli indici restano piccoli.
+-- La chiave primaria deve includere la colonna di partizionamento.
 CREATE TABLE IF NOT EXISTS events (
-    id              SERIAL PRIMARY KEY,
+    id              SERIAL,
     timestamp       TIMESTAMPTZ NOT NULL,
     camera_id       VARCHAR(50) NOT NULL REFERENCES cameras(id),
     aisle_id        VARCHAR(50),
     event_type      VARCHAR(50) NOT NULL DEFAULT 'forklift_pallet',
 
+    -- Campi del payload più filtrati, promossi a colonne (indicizzabili,
+    -- nessun parsing JSONB per riga); restano anche in raw_data
+    roi_id          VARCHAR(50),
+    roi_name        VARCHAR(100),
+    confidence      REAL,
+
     -- Dati grezzi rilevamento AI (JSONB per flessibilità)
     raw_data        JSONB,
     -- Contiene: label, confidence, bbox, tracker_id, ref_point, ecc.
@@ -46,8 +55,71 @@ CREATE TABLE IF NOT EXISTS events (
     matched_at      TIMESTAMPTZ DEFAULT NULL,
     validated       BOOLEAN DEFAULT FALSE,
 
-    created_at      TIMESTAMPTZ DEFAULT NOW()
-);
+    created_at      TIMESTAMPTZ DEFAULT NOW(),
+
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Partizione di riserva per eventi fuori dai mesi già creati
+-- (es. timestamp errati dal video analyzer): l'INSERT non fallisce mai
+CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;
+
+-- Crea le partizioni mensili (UTC) dal mese corrente a months_ahead mesi
+-- avanti. Idempotente e sicura in concorrenza. Il backend la richiama
+-- all'avvio e poi periodicamente (task di manutenzione in init_db/lifespan):
+-- senza quel task, o un pg_cron equivalente, i mesi oltre l'orizzonte
+-- finiscono in events_default.
+-- Se un mese è già finito in events_default (backend fermo a lungo), la
+-- CREATE fallisce con check_violation: il default viene staccato, la
+-- partizione creata, le righe del mese spostate e il default riattaccato.
+-- Un errore su un mese è segnalato (WARNING) e non blocca i mesi successivi.
+CREATE OR REPLACE FUNCTION create_events_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start     TIMESTAMP;
+    range_from      TIMESTAMPTZ;
+    range_to        TIMESTAMPTZ;
+    partition_name  TEXT;
+    ddl             TEXT;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => i);
+        partition_name := 'events_' || to_char(month_start, 'YYYY_MM');
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+        range_from := month_start AT TIME ZONE 'UTC';
+        range_to := (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC';
+        ddl := format(
+            'CREATE TABLE %I PARTITION OF events FOR VALUES FROM (%L) TO (%L)',
+            partition_name, range_from, range_to
+        );
+        BEGIN
+            BEGIN
+                EXECUTE ddl;
+            EXCEPTION
+                -- Creata nel frattempo da un altro processo
+                WHEN duplicate_table OR unique_violation THEN NULL;
+                -- events_default contiene già righe del mese
+                WHEN check_violation THEN
+                    ALTER TABLE events DETACH PARTITION events_default;
+                    EXECUTE ddl;
+                    INSERT INTO events
+                        SELECT * FROM events_default
+                        WHERE timestamp >= range_from AND timestamp < range_to;
+                    DELETE FROM events_default
+                        WHERE timestamp >= range_from AND timestamp < range_to;
+                    ALTER TABLE events ATTACH PARTITION events_default DEFAULT;
+                    RAISE NOTICE 'Partizione % creata spostando le righe da events_default', partition_name;
+            END;
+        EXCEPTION
+            WHEN OTHERS THEN
+                RAISE WARNING 'Creazione partizione % non riuscita: %', partition_name, SQLERRM;
+        END;
+    END LOOP;
+END;
+$$;
+
+SELECT create_events_partitions(3);
 
 -- Tabella tag WMS esterni (per matching)
 CREATE TABLE IF NOT EXISTS wms_tags (
@@ -55,20 +127,36 @@ CREATE TABLE IF NOT EXISTS wms_tags (
     timestamp       TIMESTAMPTZ NOT NULL,
     tag_data        VARCHAR(500) NOT NULL,  -- Dato dal WMS o input manuale
     aisle_id        VARCHAR(50),
-    matched_event_id INTEGER DEFAULT NULL REFERENCES events(id),
+    -- Nessuna FK: su una tabella partizionata la FK dovrebbe includere
+    -- anche timestamp (chiave primaria composta)
+    matched_event_id INTEGER DEFAULT NULL,
     created_at      TIMESTAMPTZ DEFAULT NOW()
 );
 
 -- Indici per query performanti
 CREATE INDEX idx_events_timestamp ON events(timestamp);
-CREATE INDEX idx_events_camera ON events(camera_id);
-CREATE INDEX idx_events_aisle ON events(aisle_id);
-CREATE INDEX idx_events_validated ON events(validated);
-CREATE INDEX idx_events_track ON events(track_id);
+-- Compositi filtro + ordinamento: list_events filtra e ordina per
+-- timestamp DESC con una sola index scan, senza sort esterno
+CREATE INDEX idx_events_camera_ts ON events(camera_id, timestamp DESC);
+CREATE INDEX idx_events_aisle_ts ON events(aisle_id, timestamp DESC);
+CREATE INDEX idx_events_validated_ts ON events(validated, timestamp DESC);
+CREATE INDEX idx_events_roi_ts ON events(roi_id, timestamp DESC);
+-- track_id in testa: serve sia il filtro per solo track sia track + camera
+CREATE INDEX idx_events_track_camera ON events(track_id, camera_id);
+-- Matching WMS: solo gli eventi con tag ancora da abbinare (indice parziale)
+CREATE INDEX idx_events_external_tag_unmatched ON events(external_tag)
+    WHERE external_tag IS NOT NULL AND matched_at IS NULL;
 CREATE INDEX idx_wms_tags_timestamp ON wms_tags(timestamp);
 CREATE INDEX idx_wms_tags_matched ON wms_tags(matched_event_id);
+CREATE INDEX idx_wms_tags_tag_data ON wms_tags(tag_data);
 CREATE INDEX idx_rois_camera ON rois(camera_id);
 
+-- Indici GIN per ricerche per contenimento (@>) su JSONB.
+-- jsonb_path_ops indicizza solo hash dei path: indice più piccolo e
+-- probe più veloci rispetto all'opclass di default jsonb_ops.
+CREATE INDEX idx_events_raw_data ON events USING GIN (raw_data jsonb_path_ops);
+CREATE INDEX idx_rois_points ON rois USING GIN (points jsonb_path_ops);
+
 -- Camera di esempio per sviluppo
 INSERT INTO cameras (id, name, rtsp_url, location)
 VALUES ('CAM_DEV_01', 'Camera Sviluppo', 'rtsp://localhost:554/stream1', 'Magazzino Test')
@@ -5,7 +5,7 @@ Mappano le tabelle definite in init.sql.
 
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String, Text, text
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
@@ -44,17 +44,28 @@ class ROI(Base):
     # Relazioni
     camera: Mapped["Camera"] = relationship(back_populates="rois")
 
+    __table_args__ = (
+        # GIN jsonb_path_ops: più piccolo e veloce di jsonb_ops per query @>
+        Index("idx_rois_points", "points", postgresql_using="gin", postgresql_ops={"points": "jsonb_path_ops"}),
+    )
+
 
 class Event(Base):
     """Tabella eventi rilevati dalla videoanalisi."""
     __tablename__ = "events"
 
+    # Chiave primaria (id, timestamp): la tabella è partizionata per timestamp
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
     camera_id: Mapped[str] = mapped_column(String(50), ForeignKey("cameras.id"), nullable=False)
     aisle_id: Mapped[str | None] = mapped_column(String(50))
     event_type: Mapped[str] = mapped_column(String(50), nullable=False, default="forklift_pallet")
 
+    # Campi del payload promossi a colonne (copiati anche in raw_data)
+    roi_id: Mapped[str | None] = mapped_column(String(50))
+    roi_name: Mapped[str | None] = mapped_column(String(100))
+    confidence: Mapped[float | None] = mapped_column(Float(precision=24))
+
     # Dati grezzi AI
     raw_data: Mapped[dict | None] = mapped_column(JSONB)
 
@@ -73,6 +84,24 @@ class Event(Base):
     # Relazioni
     camera: Mapped["Camera"] = relationship(back_populates="events")
 
+    __table_args__ = (
+        # Compositi filtro + ordinamento per list_events (timestamp DESC)
+        Index("idx_events_camera_ts", "camera_id", timestamp.desc()),
+        Index("idx_events_aisle_ts", "aisle_id", timestamp.desc()),
+        Index("idx_events_validated_ts", "validated", timestamp.desc()),
+        Index("idx_events_roi_ts", "roi_id", timestamp.desc()),
+        Index("idx_events_track_camera", "track_id", "camera_id"),
+        # Matching WMS: solo eventi con tag ancora da abbinare
+        Index(
+            "idx_events_external_tag_unmatched",
+            "external_tag",
+            postgresql_where=text("external_tag IS NOT NULL AND matched_at IS NULL"),
+        ),
+        # GIN jsonb_path_ops: più piccolo e veloce di jsonb_ops per query @>
+        Index("idx_events_raw_data", "raw_data", postgresql_using="gin", postgresql_ops={"raw_data": "jsonb_path_ops"}),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
 
 class WMSTag(Base):
     """Tabella tag WMS esterni per matching con eventi."""
@@ -82,5 +111,11 @@ class WMSTag(Base):
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     tag_data: Mapped[str] = mapped_column(String(500), nullable=False)
     aisle_id: Mapped[str | None] = mapped_column(String(50))
-    matched_event_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("events.id"))
+    # Senza FK: events è partizionata (vedi init.sql)
+    matched_event_id: Mapped[int | None] = mapped_column(Integer)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_wms_tags_matched", "matched_event_id"),
+        Index("idx_wms_tags_tag_data", "tag_data"),
+    )
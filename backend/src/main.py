@@ -4,17 +4,22 @@ FastAPI entry point con lifecycle management.
 
 Avvia:
 - Connessione PostgreSQL (pool async)
+- Manutenzione periodica delle partizioni mensili della tabella events
 - MQTT Listener (sottoscrizione eventi video analyzer)
 - API REST (events, cameras)
 """
 
+import asyncio
 import logging
+import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
 
-from db.database import init_db, close_db
+from db.database import init_db, close_db, events_partitions_loop
 from routers import events, cameras
 from services.mqtt_listener import MQTTListener
 
@@ -27,6 +32,39 @@ logger = logging.getLogger("Backend")
 # Istanza globale MQTT Listener
 mqtt_listener = MQTTListener()
 
+# Con più worker uvicorn (--workers / WEB_CONCURRENCY) ogni processo importa
+# questo modulo: il listener deve girare in un solo worker, altrimenti ogni
+# evento verrebbe ricevuto e persistito N volte.
+RUN_MQTT_LISTENER = os.getenv("RUN_MQTT_LISTENER", "1") == "1"
+MQTT_LISTENER_LOCK = os.getenv("MQTT_LISTENER_LOCK", "/tmp/logistics_track_mqtt.lock")
+
+# File descriptor del lock, tenuto aperto per tutta la vita del worker
+_listener_lock_fd: int | None = None
+
+
+def _acquire_listener_lock() -> bool:
+    """
+    Elegge il worker che esegue il listener MQTT.
+
+    Il primo worker che ottiene il lock esclusivo sul file lo tiene fino
+    alla terminazione del processo (il kernel lo rilascia anche in caso
+    di crash). Senza fcntl (Windows nativo) si assume un solo worker.
+    """
+    global _listener_lock_fd
+    try:
+        import fcntl
+    except ImportError:
+        return True
+
+    fd = os.open(MQTT_LISTENER_LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _listener_lock_fd = fd
+    return True
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -38,9 +76,15 @@ async def lifespan(app: FastAPI):
 
     # Database
     await init_db()
+    # Partizioni eventi dei mesi successivi, anche senza riavvii
+    partitions_task = asyncio.create_task(events_partitions_loop())
 
-    # MQTT Listener
-    await mqtt_listener.start()
+    # MQTT Listener (un solo worker)
+    listener_active = RUN_MQTT_LISTENER and _acquire_listener_lock()
+    if listener_active:
+        await mqtt_listener.start()
+    else:
+        logger.info(f"MQTT Listener non attivo in questo worker (pid={os.getpid()})")
 
     logger.info("Backend avviato.")
     logger.info("=" * 60)
@@ -49,7 +93,13 @@ async def lifespan(app: FastAPI):
 
     # --- SHUTDOWN ---
     logger.info("Shutdown in corso...")
-    await mqtt_listener.stop()
+    partitions_task.cancel()
+    try:
+        await partitions_task
+    except asyncio.CancelledError:
+        pass
+    if listener_active:
+        await mqtt_listener.stop()
     await close_db()
     logger.info("Backend terminato.")
 
@@ -73,6 +123,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(DBAPIError)
+async def db_connection_error_handler(request: Request, exc: DBAPIError) -> JSONResponse:
+    """
+    Connessione DB caduta durante la richiesta.
+
+    Senza pool_pre_ping una connessione morta emerge alla prima query:
+    SQLAlchemy la invalida e la rimuove dal pool, il client riceve 503
+    e può ritentare subito su una connessione nuova.
+    """
+    if not exc.connection_invalidated:
+        raise exc
+    logger.warning(f"Connessione database persa durante {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database temporaneamente non disponibile, riprovare"},
+        headers={"Retry-After": "1"},
+    )
+
+
 # Routers
 app.include_router(events.router)
 app.include_router(cameras.router)
@@ -81,8 +151,12 @@ app.include_router(cameras.router)
 @app.get("/health")
 async def health_check() -> dict:
     """Endpoint di controllo stato servizio."""
+    # None: listener attivo in un altro worker
+    listener_running = mqtt_listener.is_running
     return {
         "status": "ok",
         "service": "LogisticsTrack Backend",
-        "mqtt_connected": mqtt_listener._connected,
+        "mqtt_connected": mqtt_listener.is_connected if listener_running else None,
+        "mqtt_queue_depth": mqtt_listener.queue_depth if listener_running else None,
+        "mqtt_dropped": mqtt_listener.dropped if listener_running else None,
     }
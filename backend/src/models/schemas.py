@@ -1,11 +1,13 @@
 """
-LogisticsTrack — Pydantic Schemas
-Modelli per validazione request/response delle API REST.
+LogisticsTrack — Schemas
+Modelli Pydantic per validazione request/response delle API REST
+e struct msgspec per il payload MQTT del video analyzer.
 """
 
 from datetime import datetime
 from typing import Optional
 
+import msgspec
 from pydantic import BaseModel, Field
 
 
@@ -63,6 +65,9 @@ class EventBase(BaseModel):
     camera_id: str
     aisle_id: Optional[str] = None
     event_type: str = "forklift_pallet"
+    roi_id: Optional[str] = None
+    roi_name: Optional[str] = None
+    confidence: Optional[float] = None
     raw_data: Optional[dict] = None
     track_id: Optional[int] = None
     entered_at: Optional[datetime] = None
@@ -87,6 +92,15 @@ class EventListResponse(BaseModel):
     page_size: int
 
 
+class EventSummaryResponse(BaseModel):
+    """Statistiche riassuntive degli eventi."""
+    total_events: int
+    validated: int
+    unvalidated: int
+    by_type: dict[str, int]
+    by_camera: dict[str, int]
+
+
 # ---------------------------------------------------------------------------
 # WMS Tag
 # ---------------------------------------------------------------------------
@@ -111,8 +125,14 @@ class WMSTagResponse(BaseModel):
 # MQTT Event Payload (da video analyzer)
 # ---------------------------------------------------------------------------
 
-class MQTTEventPayload(BaseModel):
-    """Schema del payload MQTT pubblicato dal video analyzer."""
+class MQTTEventPayload(msgspec.Struct, kw_only=True, gc=False):
+    """
+    Schema del payload MQTT pubblicato dal video analyzer.
+
+    msgspec invece di pydantic: decodifica JSON, validazione dei tipi e
+    parsing dei timestamp ISO 8601 avvengono in un unico passaggio C,
+    direttamente sul thread di rete paho.
+    """
     schema_version: str = "1.0"
     timestamp: datetime
     event_type: str
@@ -6,7 +6,9 @@ API REST per gestione camere.
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from pydantic import TypeAdapter
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.database import get_session
@@ -17,15 +19,30 @@ logger = logging.getLogger("CamerasRouter")
 
 router = APIRouter(prefix="/api/cameras", tags=["cameras"])
 
+# Righe per blocco nello streaming delle liste
+LIST_YIELD_PER = 200
+
+# Validatore compilato una volta: valida ogni blocco in un solo passaggio
+CAMERA_LIST_ADAPTER = TypeAdapter(list[CameraResponse])
+
 
 @router.get("", response_model=list[CameraResponse])
 async def list_cameras(
     session: AsyncSession = Depends(get_session),
 ) -> list[CameraResponse]:
     """Lista tutte le camere registrate."""
-    result = await session.execute(select(Camera).order_by(Camera.name))
-    cameras = result.scalars().all()
-    return [CameraResponse.model_validate(c) for c in cameras]
+    # Righe Core (no ORM) lette a blocchi e validate un blocco alla volta
+    query = (
+        select(Camera.__table__)
+        .order_by(Camera.name)
+        .execution_options(yield_per=LIST_YIELD_PER)
+    )
+    result = await session.stream(query)
+
+    cameras: list[CameraResponse] = []
+    async for partition in result.mappings().partitions():
+        cameras.extend(CAMERA_LIST_ADAPTER.validate_python(partition))
+    return cameras
 
 
 @router.get("/{camera_id}", response_model=CameraResponse)
@@ -49,15 +66,20 @@ async def create_camera(
     session: AsyncSession = Depends(get_session),
 ) -> CameraResponse:
     """Registra una nuova camera."""
-    # Verifica duplicato
-    existing = await session.execute(select(Camera).where(Camera.id == data.id))
-    if existing.scalar_one_or_none():
+    # Insert atomico: nessuna riga restituita se l'id esiste già
+    stmt = (
+        pg_insert(Camera)
+        .values(**data.model_dump())
+        .on_conflict_do_nothing(index_elements=[Camera.id])
+        .returning(Camera)
+    )
+    result = await session.execute(stmt)
+    camera = result.scalar_one_or_none()
+
+    if camera is None:
         raise HTTPException(status_code=409, detail=f"Camera '{data.id}' già esistente")
 
-    camera = Camera(**data.model_dump())
-    session.add(camera)
     await session.commit()
-    await session.refresh(camera)
 
     logger.info(f"Camera creata: {camera.id} — {camera.name}")
     return CameraResponse.model_validate(camera)
@@ -70,19 +92,22 @@ async def update_camera(
     session: AsyncSession = Depends(get_session),
 ) -> CameraResponse:
     """Aggiorna una camera esistente."""
-    result = await session.execute(select(Camera).where(Camera.id == camera_id))
+    # UPDATE ... RETURNING: nessuna SELECT prima né refresh dopo il commit.
+    # L'id resta quello del path, come nel caso di aggiornamento via ORM.
+    stmt = (
+        update(Camera)
+        .where(Camera.id == camera_id)
+        .values(**data.model_dump(exclude={"id"}))
+        .returning(Camera)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
     camera = result.scalar_one_or_none()
 
     if camera is None:
         raise HTTPException(status_code=404, detail=f"Camera '{camera_id}' non trovata")
 
-    camera.name = data.name
-    camera.rtsp_url = data.rtsp_url
-    camera.location = data.location
-    camera.is_active = data.is_active
-
     await session.commit()
-    await session.refresh(camera)
 
     logger.info(f"Camera aggiornata: {camera.id}")
     return CameraResponse.model_validate(camera)
@@ -94,13 +119,14 @@ async def delete_camera(
     session: AsyncSession = Depends(get_session),
 ) -> None:
     """Elimina una camera (cascade su ROI associate)."""
-    result = await session.execute(select(Camera).where(Camera.id == camera_id))
-    camera = result.scalar_one_or_none()
-
-    if camera is None:
+    # DELETE ... RETURNING in un solo round-trip; le ROI sono eliminate
+    # dal vincolo ON DELETE CASCADE del database
+    result = await session.execute(
+        delete(Camera).where(Camera.id == camera_id).returning(Camera.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail=f"Camera '{camera_id}' non trovata")
 
-    await session.delete(camera)
     await session.commit()
 
     logger.info(f"Camera eliminata: {camera_id}")
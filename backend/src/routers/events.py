@@ -8,22 +8,27 @@ from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy import desc, func, select
+from pydantic import TypeAdapter
+from sqlalchemy import desc, func, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.database import get_session
 from db.models import Event
-from models.schemas import EventListResponse, EventResponse
+from models.schemas import EventListResponse, EventResponse, EventSummaryResponse
 
 logger = logging.getLogger("EventsRouter")
 
 router = APIRouter(prefix="/api/events", tags=["events"])
 
+# Validatore compilato una volta: valida l'intera pagina in un solo passaggio
+EVENT_LIST_ADAPTER = TypeAdapter(list[EventResponse])
+
 
 @router.get("", response_model=EventListResponse)
 async def list_events(
     camera_id: Optional[str] = Query(None, description="Filtra per camera"),
     aisle_id: Optional[str] = Query(None, description="Filtra per corsia"),
+    roi_id: Optional[str] = Query(None, description="Filtra per ROI"),
     event_type: Optional[str] = Query(None, description="Filtra per tipo evento"),
     track_id: Optional[int] = Query(None, description="Filtra per track ID"),
     validated: Optional[bool] = Query(None, description="Filtra per stato validazione"),
@@ -38,46 +43,53 @@ async def list_events(
 
     Ordinati per timestamp decrescente (più recenti prima).
     """
-    # Query base
-    query = select(Event)
-    count_query = select(func.count(Event.id))
-
-    # Applica filtri
+    # Filtri
+    conditions = []
     if camera_id:
-        query = query.where(Event.camera_id == camera_id)
-        count_query = count_query.where(Event.camera_id == camera_id)
+        conditions.append(Event.camera_id == camera_id)
     if aisle_id:
-        query = query.where(Event.aisle_id == aisle_id)
-        count_query = count_query.where(Event.aisle_id == aisle_id)
+        conditions.append(Event.aisle_id == aisle_id)
+    if roi_id:
+        conditions.append(Event.roi_id == roi_id)
     if event_type:
-        query = query.where(Event.event_type == event_type)
-        count_query = count_query.where(Event.event_type == event_type)
+        conditions.append(Event.event_type == event_type)
     if track_id is not None:
-        query = query.where(Event.track_id == track_id)
-        count_query = count_query.where(Event.track_id == track_id)
+        conditions.append(Event.track_id == track_id)
     if validated is not None:
-        query = query.where(Event.validated == validated)
-        count_query = count_query.where(Event.validated == validated)
+        conditions.append(Event.validated == validated)
     if date_from:
-        query = query.where(Event.timestamp >= date_from)
-        count_query = count_query.where(Event.timestamp >= date_from)
+        conditions.append(Event.timestamp >= date_from)
     if date_to:
-        query = query.where(Event.timestamp <= date_to)
-        count_query = count_query.where(Event.timestamp <= date_to)
-
-    # Conteggio totale
-    total_result = await session.execute(count_query)
-    total = total_result.scalar() or 0
+        conditions.append(Event.timestamp <= date_to)
 
-    # Paginazione + ordinamento
+    # Pagina + totale in un'unica query: count(*) OVER () viene calcolato
+    # sull'insieme filtrato prima di OFFSET/LIMIT
     offset = (page - 1) * page_size
-    query = query.order_by(desc(Event.timestamp)).offset(offset).limit(page_size)
+    query = (
+        select(Event.__table__, func.count().over().label("total"))
+        .where(*conditions)
+        .order_by(desc(Event.timestamp))
+        .offset(offset)
+        .limit(page_size)
+    )
 
     result = await session.execute(query)
-    events = result.scalars().all()
+    rows = result.mappings().all()
+
+    if rows:
+        total = rows[0]["total"]
+    elif offset > 0:
+        # Pagina oltre la fine: nessuna riga da cui leggere il totale
+        total_result = await session.execute(select(func.count(Event.id)).where(*conditions))
+        total = total_result.scalar() or 0
+    else:
+        total = 0
+
+    # Righe Core (no ORM) validate in blocco dal core Rust di pydantic
+    events = EVENT_LIST_ADAPTER.validate_python(rows)
 
     return EventListResponse(
-        events=[EventResponse.model_validate(e) for e in events],
+        events=events,
         total=total,
         page=page,
         page_size=page_size,
@@ -101,41 +113,49 @@ async def get_event(
     return EventResponse.model_validate(event)
 
 
-@router.get("/stats/summary")
+@router.get("/stats/summary", response_model=EventSummaryResponse)
 async def events_summary(
     session: AsyncSession = Depends(get_session),
-) -> dict:
+) -> EventSummaryResponse:
     """Statistiche riassuntive degli eventi."""
-    # Totale eventi
-    total_result = await session.execute(select(func.count(Event.id)))
-    total = total_result.scalar() or 0
-
-    # Per tipo
-    type_query = (
-        select(Event.event_type, func.count(Event.id))
-        .group_by(Event.event_type)
-    )
-    type_result = await session.execute(type_query)
-    by_type = {row[0]: row[1] for row in type_result.all()}
-
-    # Per camera
-    camera_query = (
-        select(Event.camera_id, func.count(Event.id))
-        .group_by(Event.camera_id)
+    # Una sola scansione: GROUPING SETS calcola in un passaggio i gruppi
+    # per tipo, per camera e il totale generale.
+    # GROUPING(event_type, camera_id) è una bitmask delle colonne escluse
+    # dal gruppo: 1 = per tipo, 2 = per camera, 3 = totale.
+    grouping = func.grouping(Event.event_type, Event.camera_id).label("grouping_id")
+    query = (
+        select(
+            grouping,
+            Event.event_type,
+            Event.camera_id,
+            func.count().label("total"),
+            func.count().filter(Event.validated.is_(True)).label("validated"),
+        )
+        .group_by(func.grouping_sets(
+            tuple_(Event.event_type),
+            tuple_(Event.camera_id),
+            tuple_(),
+        ))
     )
-    camera_result = await session.execute(camera_query)
-    by_camera = {row[0]: row[1] for row in camera_result.all()}
+    result = await session.execute(query)
 
-    # Validati vs non validati
-    validated_result = await session.execute(
-        select(func.count(Event.id)).where(Event.validated == True)
+    total = 0
+    validated_count = 0
+    by_type: dict[str, int] = {}
+    by_camera: dict[str, int] = {}
+    for row in result.all():
+        if row.grouping_id == 1:
+            by_type[row.event_type] = row.total
+        elif row.grouping_id == 2:
+            by_camera[row.camera_id] = row.total
+        else:
+            total = row.total
+            validated_count = row.validated
+
+    return EventSummaryResponse(
+        total_events=total,
+        validated=validated_count,
+        unvalidated=total - validated_count,
+        by_type=by_type,
+        by_camera=by_camera,
     )
-    validated_count = validated_result.scalar() or 0
-
-    return {
-        "total_events": total,
-        "validated": validated_count,
-        "unvalidated": total - validated_count,
-        "by_type": by_type,
-        "by_camera": by_camera,
-    }
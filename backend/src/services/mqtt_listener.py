@@ -1,25 +1,28 @@
 """
 LogisticsTrack — MQTT Listener Service
 Sottoscrive il topic MQTT degli eventi del video analyzer,
-parsa il payload JSON e persiste gli eventi su PostgreSQL.
+decodifica il payload JSON e persiste gli eventi su PostgreSQL.
 
 Si avvia come task in background insieme a FastAPI.
 """
 
 import asyncio
-import json
 import logging
 import os
-from datetime import datetime
+from enum import Enum
 from pathlib import Path
 from typing import Optional
 
+import msgspec
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 from sqlalchemy import insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection
 
-from db.database import async_session
+from db.database import writer_engine
 from db.models import Event
+from models.schemas import MQTTEventPayload
 
 # Carica .env
 _env_path = Path(__file__).resolve().parent.parent.parent.parent / ".env"
@@ -27,6 +30,39 @@ load_dotenv(_env_path)
 
 logger = logging.getLogger("MQTTListener")
 
+# INSERT Core sulla tabella (non sull'entità ORM), costruito una sola volta:
+# il percorso di scrittura non passa da Session, unit-of-work e identity map
+_INSERT_EVENT = insert(Event.__table__)
+
+# Decoder riusabile: JSON → MQTTEventPayload validato in un solo passaggio
+_PAYLOAD_DECODER = msgspec.json.Decoder(MQTTEventPayload)
+
+# Attesa tra i tentativi di scrittura con DB non disponibile (secondi,
+# raddoppia a ogni tentativo fino al massimo)
+PERSIST_RETRY_MIN_DELAY = 1.0
+PERSIST_RETRY_MAX_DELAY = 30.0
+
+
+class _InsertOutcome(Enum):
+    """Esito di un INSERT di eventi."""
+    OK = "ok"
+    DATA_ERROR = "data_error"   # Righe rifiutate (es. camera_id sconosciuta)
+    DB_ERROR = "db_error"       # DB irraggiungibile, timeout, errori operativi
+
+
+def _is_data_error(exc: DBAPIError) -> bool:
+    """
+    True se l'errore dipende dai dati delle righe e non dal database.
+
+    asyncpg non mappa tutti gli errori sulle sottoclassi SQLAlchemy (es.
+    valore troppo lungo → DBAPIError generico): fa fede anche la classe
+    SQLSTATE, 22 = data exception, 23 = violazione di vincolo.
+    """
+    if isinstance(exc, (IntegrityError, DataError)):
+        return True
+    sqlstate = str(getattr(exc.orig, "sqlstate", None) or "")
+    return sqlstate[:2] in ("22", "23")
+
 
 class MQTTListener:
     """
@@ -40,10 +76,17 @@ class MQTTListener:
         self._topic = os.getenv("MQTT_TOPIC_EVENTS", "logistics/events")
         self._client: Optional[mqtt.Client] = None
         self._connected = False
-        self._event_queue: asyncio.Queue = asyncio.Queue()
+        # Coda limitata: se il DB rallenta la memoria resta costante e gli
+        # eventi in eccesso vengono scartati (e contati) invece di accumularsi
+        self._event_queue: asyncio.Queue = asyncio.Queue(
+            maxsize=int(os.getenv("MQTT_QUEUE_MAXSIZE", "10000"))
+        )
         self._persist_task: Optional[asyncio.Task] = None
+        self._writer_conn: Optional[AsyncConnection] = None
         self._running = False
         self._events_persisted = 0
+        self._events_dropped = 0
+        self._batch_size = int(os.getenv("MQTT_PERSIST_BATCH_SIZE", "500"))
 
     # -------------------------------------------------------------------
     # Lifecycle
@@ -67,6 +110,7 @@ class MQTTListener:
             self._client.on_connect = self._on_connect
             self._client.on_disconnect = self._on_disconnect
             self._client.on_message = self._on_message
+            self._client.reconnect_delay_set(min_delay=1, max_delay=30)
 
             self._client.connect(self._broker, self._port, keepalive=60)
             self._client.loop_start()
@@ -91,7 +135,33 @@ class MQTTListener:
             except asyncio.CancelledError:
                 pass
 
-        logger.info(f"MQTT Listener fermato. Totale eventi persistiti: {self._events_persisted}")
+        logger.info(
+            f"MQTT Listener fermato. Totale eventi persistiti: {self._events_persisted}, "
+            f"scartati: {self._events_dropped}"
+        )
+
+    # -------------------------------------------------------------------
+    # Stato (sola lettura)
+    # -------------------------------------------------------------------
+
+    @property
+    def is_running(self) -> bool:
+        """True se il listener è avviato in questo processo."""
+        return self._running
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def queue_depth(self) -> int:
+        """Eventi ricevuti in attesa di persistenza."""
+        return self._event_queue.qsize()
+
+    @property
+    def dropped(self) -> int:
+        """Eventi scartati (coda piena o DB non disponibile in chiusura)."""
+        return self._events_dropped
 
     # -------------------------------------------------------------------
     # Callbacks MQTT (eseguiti nel thread paho)
@@ -114,22 +184,44 @@ class MQTTListener:
     def _on_message(self, client, userdata, msg) -> None:
         """Riceve messaggio MQTT e lo mette in coda per la persistenza async."""
         try:
-            payload = json.loads(msg.payload.decode("utf-8"))
+            # Decodifica + validazione + parsing timestamp in C, direttamente
+            # dai bytes: il thread paho resta libero nei burst
+            payload = _PAYLOAD_DECODER.decode(msg.payload)
             # Thread-safe: usa il loop salvato in start()
-            self._loop.call_soon_threadsafe(self._event_queue.put_nowait, payload)
-            logger.debug(f"Evento ricevuto: {payload.get('event_type')} track={payload.get('track_id')}")
-        except json.JSONDecodeError as e:
+            self._loop.call_soon_threadsafe(self._enqueue, payload)
+            logger.debug(f"Evento ricevuto: {payload.event_type} track={payload.track_id}")
+        except msgspec.DecodeError as e:
             logger.error(f"Payload MQTT non valido: {e}")
         except Exception as e:
             logger.error(f"Errore processamento messaggio MQTT: {e}")
 
+    def _enqueue(self, payload: MQTTEventPayload) -> None:
+        """Accoda un payload (nel loop asyncio); a coda piena lo scarta e lo conta."""
+        try:
+            self._event_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self._events_dropped += 1
+            # Log limitato: il primo scarto e poi uno ogni 1000
+            if self._events_dropped % 1000 == 1:
+                logger.warning(
+                    f"Coda eventi piena ({self._event_queue.maxsize}), evento scartato "
+                    f"[scartati totali: {self._events_dropped}]"
+                )
+
     # -------------------------------------------------------------------
     # Persistenza asincrona
     # -------------------------------------------------------------------
 
     async def _persist_loop(self) -> None:
-        """Loop che preleva eventi dalla coda e li persiste su DB."""
-        logger.info("Task di persistenza avviato.")
+        """
+        Loop che preleva eventi dalla coda e li persiste su DB a batch.
+
+        Attende il primo evento, poi drena senza attese tutto ciò che è
+        già in coda (fino a batch_size) e scrive con un unico INSERT
+        executemany + un solo commit: round-trip e flush WAL sono
+        ammortizzati sull'intero batch.
+        """
+        logger.info(f"Task di persistenza avviato (batch max {self._batch_size} eventi).")
 
         while self._running:
             try:
@@ -139,76 +231,160 @@ class MQTTListener:
                 except asyncio.TimeoutError:
                     continue
 
-                await self._persist_event(payload)
+                await self._persist_batch(self._drain_batch(payload))
 
             except asyncio.CancelledError:
                 # Svuota la coda prima di uscire
                 while not self._event_queue.empty():
-                    try:
-                        payload = self._event_queue.get_nowait()
-                        await self._persist_event(payload)
-                    except asyncio.QueueEmpty:
-                        break
+                    await self._persist_batch(self._drain_batch())
+                await self._close_writer_conn()
                 raise
 
             except Exception as e:
                 logger.error(f"Errore nel loop di persistenza: {e}", exc_info=True)
                 await asyncio.sleep(1.0)
 
-    async def _persist_event(self, payload: dict) -> None:
-        """Persiste un singolo evento MQTT su PostgreSQL."""
+    def _drain_batch(self, first: Optional[MQTTEventPayload] = None) -> list[MQTTEventPayload]:
+        """Preleva dalla coda, senza attendere, fino a batch_size payload."""
+        batch = [first] if first is not None else []
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._event_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _persist_batch(self, payloads: list[MQTTEventPayload]) -> None:
+        """Persiste un batch di eventi MQTT su PostgreSQL in un'unica transazione."""
+        # I payload sono già validati dal decoder msgspec in _on_message
+        rows = [self._payload_to_row(payload) for payload in payloads]
+        if not rows:
+            return
+
+        outcome = await self._insert_with_retry(rows)
+        if outcome is _InsertOutcome.DATA_ERROR and len(rows) > 1:
+            # Un evento non valido (es. camera_id sconosciuta) fa fallire
+            # l'intero batch: ripiega su insert singoli per salvare gli altri.
+            # Solo per errori sui dati: con il DB giù sarebbero N fallimenti.
+            logger.warning(f"Batch di {len(rows)} eventi rifiutato, ritento con insert singoli.")
+            for row in rows:
+                await self._insert_with_retry([row])
+
+    async def _insert_with_retry(self, rows: list[dict]) -> _InsertOutcome:
+        """
+        INSERT delle righe, ritentato con backoff finché il DB non torna
+        disponibile. Gli errori sui dati non sono ritentati. In chiusura
+        (listener fermato) le righe non scrivibili sono scartate e contate.
+        """
+        delay = PERSIST_RETRY_MIN_DELAY
+        while True:
+            outcome = await self._insert_rows(rows)
+            if outcome is not _InsertOutcome.DB_ERROR:
+                return outcome
+            if not self._running:
+                self._events_dropped += len(rows)
+                logger.error(f"Database non disponibile in chiusura: {len(rows)} eventi scartati.")
+                return outcome
+            logger.warning(f"Database non disponibile, nuovo tentativo per {len(rows)} eventi tra {delay:.0f}s.")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._events_dropped += len(rows)
+                logger.error(f"Listener fermato durante l'attesa: {len(rows)} eventi scartati.")
+                raise
+            delay = min(delay * 2, PERSIST_RETRY_MAX_DELAY)
+
+    async def _insert_rows(self, rows: list[dict], retry: bool = True) -> _InsertOutcome:
+        """INSERT executemany + commit unico. Ritorna l'esito (OK, errore sui dati o del DB)."""
         try:
-            event_type = payload.get("event_type", "unknown")
-            timestamp_str = payload.get("timestamp")
-            camera_id = payload.get("camera_id", "unknown")
-            aisle_id = payload.get("aisle_id")
-            track_id = payload.get("track_id")
-            dwell_seconds = payload.get("dwell_seconds", 0.0)
-
-            # Parse timestamp ISO 8601
-            timestamp = datetime.fromisoformat(timestamp_str) if timestamp_str else datetime.utcnow()
-
-            # Costruisci raw_data con tutti i dati del payload
-            raw_data = {
-                "schema_version": payload.get("schema_version"),
-                "roi_id": payload.get("roi_id"),
-                "roi_name": payload.get("roi_name"),
-                "confidence": payload.get("confidence"),
-                "bbox": payload.get("bbox"),
-                "reference_point": payload.get("reference_point"),
-                "dwell_seconds": dwell_seconds,
-                "parent_roi_id": payload.get("parent_roi_id"),
-            }
-
-            # Determina entered_at/exited_at in base al tipo evento
-            entered_at = None
-            exited_at = None
-            if event_type == "roi_enter":
-                entered_at = timestamp
-            elif event_type == "roi_exit":
-                exited_at = timestamp
-
-            async with async_session() as session:
-                stmt = insert(Event).values(
-                    timestamp=timestamp,
-                    camera_id=camera_id,
-                    aisle_id=aisle_id,
-                    event_type=event_type,
-                    raw_data=raw_data,
-                    track_id=track_id,
-                    entered_at=entered_at,
-                    exited_at=exited_at,
+            conn = await self._get_writer_conn()
+            async with conn.begin():
+                await conn.execute(_INSERT_EVENT, rows)
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                # Connessione caduta (restart DB, rete): riapri e ritenta una volta
+                await self._close_writer_conn()
+                if retry:
+                    logger.warning("Connessione DB del writer persa, riconnessione...")
+                    return await self._insert_rows(rows, retry=False)
+            logger.error(f"Errore persistenza {len(rows)} eventi: {e}", exc_info=len(rows) == 1)
+            if _is_data_error(e):
+                return _InsertOutcome.DATA_ERROR
+            # Errore del DB anche senza connessione invalidata (statement
+            # timeout, OperationalError/InterfaceError, ...): la connessione
+            # persistente può essere in uno stato inconsistente, il
+            # tentativo successivo ne apre una nuova
+            await self._close_writer_conn()
+            return _InsertOutcome.DB_ERROR
+        except Exception as e:
+            # Connessione rifiutata, timeout di connessione, ...
+            logger.error(f"Errore persistenza {len(rows)} eventi: {e}", exc_info=len(rows) == 1)
+            await self._close_writer_conn()
+            return _InsertOutcome.DB_ERROR
+
+        self._events_persisted += len(rows)
+        if logger.isEnabledFor(logging.DEBUG):
+            for row in rows:
+                logger.debug(
+                    f"Evento persistito: {row['event_type']} | "
+                    f"track={row['track_id']} | camera={row['camera_id']} | "
+                    f"aisle={row['aisle_id']} | dwell={row['raw_data']['dwell_seconds']:.1f}s"
                 )
-                await session.execute(stmt)
-                await session.commit()
-
-            self._events_persisted += 1
-            logger.info(
-                f"Evento persistito: {event_type} | "
-                f"track={track_id} | camera={camera_id} | "
-                f"aisle={aisle_id} | dwell={dwell_seconds:.1f}s "
-                f"[totale: {self._events_persisted}]"
-            )
-
+        logger.info(f"Persistiti {len(rows)} eventi [totale: {self._events_persisted}]")
+        return _InsertOutcome.OK
+
+    async def _get_writer_conn(self) -> AsyncConnection:
+        """Ritorna la connessione di scrittura persistente, aprendola se necessario."""
+        if self._writer_conn is None or self._writer_conn.closed:
+            self._writer_conn = await writer_engine.connect()
+        return self._writer_conn
+
+    async def _close_writer_conn(self) -> None:
+        """Chiude la connessione di scrittura, ignorando errori su connessioni già cadute."""
+        if self._writer_conn is None:
+            return
+        try:
+            await self._writer_conn.close()
         except Exception as e:
-            logger.error(f"Errore persistenza evento: {e}", exc_info=True)
\ No newline at end of file
+            logger.debug(f"Chiusura connessione writer: {e}")
+        self._writer_conn = None
+
+    @staticmethod
+    def _payload_to_row(payload: MQTTEventPayload) -> dict:
+        """Converte un payload MQTT nel dizionario colonne per la tabella events."""
+        event_type = payload.event_type
+        timestamp = payload.timestamp
+
+        # Costruisci raw_data con tutti i dati del payload
+        raw_data = {
+            "schema_version": payload.schema_version,
+            "roi_id": payload.roi_id,
+            "roi_name": payload.roi_name,
+            "confidence": payload.confidence,
+            "bbox": payload.bbox,
+            "reference_point": payload.reference_point,
+            "dwell_seconds": payload.dwell_seconds,
+            "parent_roi_id": payload.parent_roi_id,
+        }
+
+        # Determina entered_at/exited_at in base al tipo evento
+        entered_at = None
+        exited_at = None
+        if event_type == "roi_enter":
+            entered_at = timestamp
+        elif event_type == "roi_exit":
+            exited_at = timestamp
+
+        return {
+            "timestamp": timestamp,
+            "camera_id": payload.camera_id,
+            "aisle_id": payload.aisle_id,
+            "event_type": event_type,
+            "roi_id": payload.roi_id,
+            "roi_name": payload.roi_name,
+            "confidence": payload.confidence,
+            "raw_data": raw_data,
+            "track_id": payload.track_id,
+            "entered_at": entered_at,
+            "exited_at": exited_at,
+        }
@@ -4,7 +4,8 @@ Configurazione centralizzata. Legge da file .env e variabili ambiente.
 """
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -13,49 +14,74 @@ from dotenv import load_dotenv
 _env_path = Path(__file__).resolve().parent.parent.parent / ".env"
 load_dotenv(_env_path)
 
+# Snapshot delle variabili ambiente, letto una sola volta dopo il .env
+_ENV = dict(os.environ)
+
+
+def _parse_target_classes(value: str) -> list[int] | None:
+    """Converte "0,2,7" in [0, 2, 7]; stringa vuota → None (tutte le classi)."""
+    if not value:
+        return None
+    return [int(c.strip()) for c in value.split(",")]
+
+
+# Classi da rilevare, parsate una volta all'import
+_TARGET_CLASSES = _parse_target_classes(_ENV.get("TARGET_CLASSES", ""))
+
 
 @dataclass
 class VideoAnalyzerConfig:
     """Configurazione completa del Video Analyzer."""
 
     # Sorgente video: path file MP4 o URL RTSP
-    video_source: str = os.getenv("VIDEO_SOURCE", "data/videos/test.mp4")
+    video_source: str = _ENV.get("VIDEO_SOURCE", "data/videos/test.mp4")
 
     # Modello YOLO
-    yolo_model: str = os.getenv("YOLO_MODEL", "yolov8n.pt")
-    yolo_confidence: float = float(os.getenv("YOLO_CONFIDENCE", "0.4"))
-    yolo_device: str = os.getenv("YOLO_DEVICE", "0")  # "0" = GPU, "cpu" = CPU
+    yolo_model: str = _ENV.get("YOLO_MODEL", "yolov8n.pt")
+    yolo_confidence: float = float(_ENV.get("YOLO_CONFIDENCE", "0.4"))
+    yolo_device: str = _ENV.get("YOLO_DEVICE", "0")  # "0" = GPU, "cpu" = CPU
+    # Lato lungo dell'input del modello (multiplo di 32): meno pixel → inferenza più veloce
+    yolo_imgsz: int = int(_ENV.get("YOLO_IMGSZ", "640"))
+    # FP16 su GPU (ignorato su CPU/MPS)
+    yolo_half: bool = _ENV.get("YOLO_HALF", "true").lower() == "true"
+    # Esporta/usa un engine TensorRT accanto al .pt (solo GPU NVIDIA)
+    yolo_use_trt: bool = _ENV.get("YOLO_USE_TRT", "false").lower() == "true"
 
     # Tracking
-    tracker_type: str = os.getenv("TRACKER_TYPE", "bytetrack.yaml")
+    tracker_type: str = _ENV.get("TRACKER_TYPE", "bytetrack.yaml")
+
+    # Frame per chiamata di inferenza (1 = frame per frame, latenza minima).
+    # Con valori >1 lo stream accumula N frame prima della detection.
+    batch_size: int = int(_ENV.get("BATCH_SIZE", "1"))
 
     # Classi da rilevare (indici COCO dataset)
     # Per prototipo: person=0, bicycle=1, car=2, truck=7
     # In produzione con modello custom: forklift, pallet, forklift_with_pallet
-    target_classes: list[int] | None = None
+    target_classes: list[int] | None = field(
+        default_factory=lambda: list(_TARGET_CLASSES) if _TARGET_CLASSES else None
+    )
 
     # Video processing
-    frame_width: int = int(os.getenv("FRAME_WIDTH", "1280"))
-    frame_height: int = int(os.getenv("FRAME_HEIGHT", "720"))
-    show_display: bool = os.getenv("SHOW_DISPLAY", "true").lower() == "true"
+    frame_width: int = int(_ENV.get("FRAME_WIDTH", "1280"))
+    frame_height: int = int(_ENV.get("FRAME_HEIGHT", "720"))
+    show_display: bool = _ENV.get("SHOW_DISPLAY", "true").lower() == "true"
+    # Differenza media (0-255, su miniatura 64x36 in grigi) sotto la quale il
+    # frame è considerato statico e la detection viene saltata. 0 = disattivo.
+    motion_threshold: float = float(_ENV.get("MOTION_THRESHOLD", "0"))
 
     # MQTT (usato in Fase 2)
-    mqtt_broker: str = os.getenv("MQTT_BROKER", "localhost")
-    mqtt_port: int = int(os.getenv("MQTT_PORT", "1883"))
-    mqtt_topic: str = os.getenv("MQTT_TOPIC_EVENTS", "logistics/events")
+    mqtt_broker: str = _ENV.get("MQTT_BROKER", "localhost")
+    mqtt_port: int = int(_ENV.get("MQTT_PORT", "1883"))
+    mqtt_topic: str = _ENV.get("MQTT_TOPIC_EVENTS", "logistics/events")
 
     # RTSP reconnection
-    rtsp_reconnect_delay: int = int(os.getenv("RTSP_RECONNECT_DELAY", "5"))
+    rtsp_reconnect_delay: int = int(_ENV.get("RTSP_RECONNECT_DELAY", "5"))
+    # Decodifica hardware dello stream (se FFmpeg/OpenCV la supportano, altrimenti CPU)
+    rtsp_hw_decode: bool = _ENV.get("RTSP_HW_DECODE", "true").lower() == "true"
 
     # ROI
-    roi_file: str = os.getenv("ROI_FILE", "data/rois.json")
-    camera_id: str = os.getenv("CAMERA_ID", "CAM_DEV_01")
-
-    def __post_init__(self) -> None:
-        """Parsing target_classes da env se presente."""
-        classes_env = os.getenv("TARGET_CLASSES", "")
-        if classes_env:
-            self.target_classes = [int(c.strip()) for c in classes_env.split(",")]
+    roi_file: str = _ENV.get("ROI_FILE", "data/rois.json")
+    camera_id: str = _ENV.get("CAMERA_ID", "CAM_DEV_01")
 
     @property
     def is_rtsp(self) -> bool:
@@ -66,3 +92,9 @@ class VideoAnalyzerConfig:
     def is_file(self) -> bool:
         """True se la sorgente è un file locale."""
         return not self.is_rtsp
+
+
+@lru_cache(maxsize=1)
+def get_config() -> VideoAnalyzerConfig:
+    """Configurazione condivisa del processo (creata alla prima chiamata)."""
+    return VideoAnalyzerConfig()
@@ -4,18 +4,56 @@ Usa Ultralytics YOLOv8 per detection e tracking di muletti e pallet.
 """
 
 import logging
+import threading
+import time
 from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
 
 import cv2
 import numpy as np
+import yaml
 from ultralytics import YOLO
+from ultralytics.cfg import DEFAULT_CFG_DICT
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils.checks import check_yaml
 
 from config import VideoAnalyzerConfig
 
 logger = logging.getLogger("Detector")
 
 
-@dataclass
+@lru_cache(maxsize=1024)
+def _text_size(label: str, scale: float, thickness: int) -> tuple[int, int]:
+    """Dimensioni (w, h) di un testo HERSHEY_SIMPLEX, memorizzate per label."""
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)[0]
+
+
+@lru_cache(maxsize=1024)
+def _label_sprite(label: str, color: tuple[int, int, int]) -> np.ndarray:
+    """
+    Label già rasterizzata (sfondo pieno + testo bianco), memorizzata per
+    (testo, colore): con ID di tracking stabili le label si ripetono tra
+    frame e il disegno diventa una copia di memoria.
+    """
+    label_w, label_h = _text_size(label, 0.6, 2)
+    sprite = np.empty((label_h + 11, label_w + 7, 3), dtype=np.uint8)
+    sprite[:] = color
+    cv2.putText(sprite, label, (3, label_h + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    return sprite
+
+
+def _blit(frame: np.ndarray, sprite: np.ndarray, x: int, y: int) -> None:
+    """Copia sprite nel frame con l'angolo in alto a sinistra in (x, y), ritagliando ai bordi."""
+    h, w = sprite.shape[:2]
+    fx1, fy1 = max(x, 0), max(y, 0)
+    fx2, fy2 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    if fx1 < fx2 and fy1 < fy2:
+        frame[fy1:fy2, fx1:fx2] = sprite[fy1 - y:fy2 - y, fx1 - x:fx2 - x]
+
+
+@dataclass(slots=True, frozen=True)
 class Detection:
     """Singola detection rilevata nel frame."""
     track_id: int          # ID tracking persistente (-1 se non tracciato)
@@ -31,111 +69,307 @@ class Detector:
     """
     Motore di detection e tracking basato su YOLOv8.
 
-    Utilizza il tracking integrato di Ultralytics (ByteTrack o BoTSORT)
-    per assegnare ID persistenti agli oggetti tra frame consecutivi.
+    Esegue la sola inferenza con predict() e passa le box a un tracker
+    Ultralytics (ByteTrack o BoTSORT) istanziato una volta e mantenuto
+    come attributo: niente callback e wrapping del tracker a ogni frame
+    come avviene con model.track().
     """
 
-    # Colori per visualizzazione (per track_id % len)
-    COLORS = [
+    # Colori per visualizzazione: 16 (potenza di 2) → indice con track_id & 15
+    COLORS = (
         (255, 100, 100), (100, 255, 100), (100, 100, 255),
         (255, 255, 100), (255, 100, 255), (100, 255, 255),
         (200, 150, 50),  (50, 200, 150),  (150, 50, 200),
         (255, 200, 100), (100, 200, 255), (200, 100, 255),
-    ]
+        (150, 200, 50),  (50, 150, 200),  (200, 50, 150),
+        (180, 180, 180),
+    )
+    _COLOR_MASK = len(COLORS) - 1
 
     def __init__(self, config: VideoAnalyzerConfig) -> None:
         self.config = config
         self.model: YOLO | None = None
-        self._load_model()
+        self._class_names: tuple[str, ...] = ()    # Nomi classi per indice (da _load_model)
+        # Un tracker per stream: gli ID e lo stato Kalman non si mescolano
+        # tra camere diverse elaborate nello stesso batch
+        self._trackers: dict[str, object] = {}
+        # FP16 solo su GPU CUDA: su CPU/MPS non è supportato
+        self._half = config.yolo_half and config.yolo_device.lower() not in ("cpu", "mps")
+        # Argomento di precisione, deciso una volta: "quantize" nelle versioni
+        # Ultralytics recenti ("half" è deprecato e logga un warning a ogni
+        # chiamata), "half" nelle precedenti. FP32 è il default: nessun argomento.
+        if not self._half:
+            self._precision_args: dict = {}
+        elif "quantize" in DEFAULT_CFG_DICT:
+            self._precision_args = {"quantize": 16}
+        else:
+            self._precision_args = {"half": True}
+        self._tracker_cfg = self._load_tracker_config()
+
+        # Caricamento + warm-up del modello in background: l'apertura della
+        # sorgente video e l'avvio della pipeline procedono in parallelo,
+        # la prima inferenza attende il completamento (_wait_for_model)
+        self._load_error: Exception | None = None
+        self._load_thread: threading.Thread | None = threading.Thread(
+            target=self._load_model_background, name="model-load", daemon=True
+        )
+        self._load_thread.start()
+
+    def _load_model_background(self) -> None:
+        """Target del thread di caricamento: conserva l'errore per la prima inferenza."""
+        try:
+            self._load_model()
+        except Exception as e:
+            logger.error(f"Errore caricamento modello YOLO: {e}")
+            self._load_error = e
+
+    def _wait_for_model(self) -> None:
+        """Attende il caricamento del modello; rilancia l'eventuale errore."""
+        # Non basta self.model: è assegnato prima della fine del warm-up
+        if self._load_thread is not None:
+            self._load_thread.join()
+            self._load_thread = None
+        if self._load_error is not None:
+            raise RuntimeError("Modello YOLO non disponibile") from self._load_error
 
     def _load_model(self) -> None:
         """Carica il modello YOLO. Scarica automaticamente se non presente."""
         model_path = self.config.yolo_model
         logger.info(f"Caricamento modello YOLO: {model_path}")
         logger.info(f"Device: {self.config.yolo_device}")
+        logger.info(f"Input: {self.config.yolo_imgsz}px, FP16: {self._half}")
+
+        if self.config.yolo_use_trt:
+            model_path = self._ensure_engine(model_path)
 
-        self.model = YOLO(model_path)
+        self.model = YOLO(model_path, task="detect")
 
         # Verifica classi disponibili
         class_names = self.model.names
         logger.info(f"Classi disponibili nel modello: {len(class_names)}")
 
+        # Nomi indicizzati per class_id: tupla invece di dict nel loop delle detection
+        self._class_names = tuple(
+            class_names.get(c, f"class_{c}") for c in range(max(class_names, default=-1) + 1)
+        )
+
         if self.config.target_classes:
             target_names = [class_names.get(c, "?") for c in self.config.target_classes]
             logger.info(f"Classi filtrate: {target_names}")
         else:
             logger.info("Nessun filtro classi attivo — rilevo tutto.")
 
-    def detect_and_track(self, frame: np.ndarray) -> list[Detection]:
+        self._warmup()
+
+    def _warmup(self) -> None:
+        """
+        Inferenza a vuoto su frame neri delle dimensioni attese.
+
+        Allocazioni CUDA, autotune cuDNN e setup del predictor avvengono qui,
+        all'avvio, invece che sul primo frame reale della pipeline.
+        Il tracker non viene scaldato: un update consumerebbe ID e stato.
+        """
+        dummy = np.zeros((self.config.frame_height, self.config.frame_width, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self._predict([dummy] * self.config.batch_size)
+        logger.info(f"Warm-up modello completato in {time.perf_counter() - start:.2f}s")
+
+    def _predict(self, frames: list[np.ndarray]) -> list:
+        """Sola inferenza YOLO su un batch di frame, con i parametri della config."""
+        return self.model.predict(
+            source=frames,
+            conf=self.config.yolo_confidence,
+            device=self.config.yolo_device,
+            imgsz=self.config.yolo_imgsz,
+            classes=self.config.target_classes,     # Filtra classi (None = tutte)
+            verbose=False,                         # No output console per ogni frame
+            **self._precision_args,                # FP16 su GPU
+        )
+
+    def _ensure_engine(self, model_path: str) -> str:
+        """
+        Ritorna il path di un engine TensorRT per il modello, esportandolo
+        alla prima esecuzione. In caso di errore ripiega sul modello .pt.
+
+        L'engine è specifico per input, precisione e batch massimo: questi
+        parametri sono nel nome del file, così un cambio di configurazione
+        genera un nuovo engine invece di caricarne uno incompatibile.
+        """
+        if self.config.yolo_device.lower() in ("cpu", "mps"):
+            logger.warning("TensorRT richiede una GPU NVIDIA: uso il modello PyTorch.")
+            return model_path
+
+        source = Path(model_path)
+        if source.suffix == ".engine":
+            return model_path
+
+        batch = self.config.batch_size
+        precision = "fp16" if self._half else "fp32"
+        engine_path = source.with_name(
+            f"{source.stem}_{self.config.yolo_imgsz}_{precision}_b{batch}.engine"
+        )
+        if engine_path.exists():
+            logger.info(f"Engine TensorRT trovato: {engine_path}")
+            return str(engine_path)
+
+        logger.info(f"Export TensorRT di {model_path} (può richiedere alcuni minuti)...")
+        try:
+            exported = YOLO(model_path).export(
+                format="engine",
+                imgsz=self.config.yolo_imgsz,
+                batch=batch,
+                dynamic=batch > 1,              # Accetta anche batch parziali
+                device=self.config.yolo_device,
+                **self._precision_args,
+            )
+            Path(exported).replace(engine_path)
+        except Exception as e:
+            logger.error(f"Export TensorRT fallito, uso il modello PyTorch: {e}")
+            return model_path
+
+        logger.info(f"Engine TensorRT salvato: {engine_path}")
+        return str(engine_path)
+
+    def _load_tracker_config(self) -> SimpleNamespace:
+        """Legge la config YAML Ultralytics del tracker (es. bytetrack.yaml)."""
+        with open(check_yaml(self.config.tracker_type), encoding="utf-8") as f:
+            tracker_cfg = SimpleNamespace(**yaml.safe_load(f))
+
+        if tracker_cfg.tracker_type not in TRACKER_MAP:
+            raise ValueError(
+                f"Tracker non supportato: '{tracker_cfg.tracker_type}' "
+                f"(disponibili: {sorted(TRACKER_MAP)})"
+            )
+
+        logger.info(f"Tracker: {tracker_cfg.tracker_type} ({self.config.tracker_type})")
+        return tracker_cfg
+
+    def _get_tracker(self, stream_id: str):
+        """Ritorna il tracker dello stream, creandolo al primo frame."""
+        tracker = self._trackers.get(stream_id)
+        if tracker is None:
+            tracker_cls = TRACKER_MAP[self._tracker_cfg.tracker_type]
+            tracker = self._trackers[stream_id] = tracker_cls(args=self._tracker_cfg)
+        return tracker
+
+    def detect_and_track(self, frame: np.ndarray, stream_id: str = "default") -> list[Detection]:
         """
         Esegue detection + tracking su un singolo frame.
 
         Args:
             frame: Frame BGR da OpenCV.
+            stream_id: Identificativo dello stream (tracker dedicato).
 
         Returns:
             Lista di Detection con tracking ID persistente.
         """
-        if self.model is None:
-            return []
+        return self.detect_and_track_batch([frame], [stream_id])[0]
 
-        # Esegui tracking (detection + associazione ID)
-        results = self.model.track(
-            source=frame,
-            persist=True,                          # Mantieni tracking tra frame
-            conf=self.config.yolo_confidence,
-            device=self.config.yolo_device,
-            tracker=self.config.tracker_type,
-            classes=self.config.target_classes,     # Filtra classi (None = tutte)
-            verbose=False,                         # No output console per ogni frame
-        )
+    def detect_and_track_batch(
+        self,
+        frames: list[np.ndarray],
+        stream_ids: list[str] | None = None,
+    ) -> list[list[Detection]]:
+        """
+        Esegue detection su più frame con una sola chiamata al modello,
+        poi il tracking frame per frame nel tracker del rispettivo stream.
 
-        detections: list[Detection] = []
+        Frame dello stesso stream vanno passati in ordine temporale.
 
-        if not results or len(results) == 0:
-            return detections
+        Args:
+            frames: Frame BGR da OpenCV.
+            stream_ids: Stream di ogni frame (default: tutti "default").
 
-        result = results[0]
+        Returns:
+            Lista di detection per ciascun frame, nello stesso ordine.
+        """
+        if not frames:
+            return []
+        self._wait_for_model()
+        if stream_ids is None:
+            stream_ids = ["default"] * len(frames)
 
-        # Estrai boxes con tracking
-        if result.boxes is None or len(result.boxes) == 0:
-            return detections
+        # Solo inferenza, un batch unico: il tracking è fatto dai tracker per stream
+        results = self._predict(frames)
 
-        boxes = result.boxes
-        for i in range(len(boxes)):
-            # Coordinate bounding box
-            x1, y1, x2, y2 = boxes.xyxy[i].cpu().numpy().astype(int)
+        # Tracker creati prima di qualsiasi update: nelle versioni Ultralytics
+        # con contatore ID globale il costruttore lo azzera
+        trackers = [self._get_tracker(stream_id) for stream_id in stream_ids]
 
-            # Classe e confidenza
-            class_id = int(boxes.cls[i].cpu().numpy())
-            confidence = float(boxes.conf[i].cpu().numpy())
-            class_name = self.model.names.get(class_id, f"class_{class_id}")
+        return [
+            self._track_result(result, frame, tracker)
+            for result, frame, tracker in zip(results, frames, trackers)
+        ]
 
-            # Tracking ID (-1 se il tracker non ha assegnato un ID)
-            track_id = -1
-            if boxes.id is not None:
-                track_id = int(boxes.id[i].cpu().numpy())
+    def _track_result(self, result, frame: np.ndarray, tracker) -> list[Detection]:
+        """Aggiorna il tracker con le box di un risultato e costruisce le Detection."""
+        if result.boxes is None:
+            return []
 
-            # Punti di riferimento
-            cx = (x1 + x2) // 2
-            cy = (y1 + y2) // 2
-            bx = cx
-            by = y2  # Bottom center
+        # Un solo trasferimento device → host per l'intero set di box.
+        # Il tracker va aggiornato anche senza detection (invecchia le tracce).
+        boxes = result.boxes.cpu().numpy()
+        tracks = tracker.update(boxes, frame)
+
+        if len(tracks) == 0:
+            # Nessuna traccia aggiornata (anche con tracce nuove non ancora
+            # confermate): detection grezze con track_id -1, disegnate ma
+            # ignorate dal ROI engine
+            if len(boxes) == 0:
+                return []
+            return self._build_detections(
+                boxes.xyxy,
+                boxes.cls,
+                boxes.conf,
+                np.full(len(boxes), -1, dtype=np.int32),
+            )
+
+        # Righe tracker: [x1, y1, x2, y2, track_id, score, cls, idx].
+        # Le box sono stime del filtro di Kalman e possono uscire dal frame:
+        # clip ai bordi come fa model.track() (Results.update → clip_boxes)
+        h, w = frame.shape[:2]
+        xyxy = tracks[:, :4].copy()
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+        return self._build_detections(xyxy, tracks[:, 6], tracks[:, 5], tracks[:, 4])
 
-            detection = Detection(
+    def _build_detections(
+        self,
+        xyxy: np.ndarray,
+        class_ids: np.ndarray,
+        confidences: np.ndarray,
+        track_ids: np.ndarray,
+    ) -> list[Detection]:
+        """Costruisce le Detection da array numpy paralleli (una riga per oggetto)."""
+        xyxy = xyxy.astype(np.int32)
+
+        # Punti di riferimento calcolati sull'intero array
+        cxs = (xyxy[:, 0] + xyxy[:, 2]) // 2
+        cys = (xyxy[:, 1] + xyxy[:, 3]) // 2
+
+        # Conversione a int/float Python in blocco (tolist), non per elemento
+        names = self._class_names
+        return [
+            Detection(
                 track_id=track_id,
                 class_id=class_id,
-                class_name=class_name,
+                class_name=names[class_id],
                 confidence=confidence,
                 bbox=(x1, y1, x2, y2),
                 center=(cx, cy),
-                bottom_center=(bx, by),
+                bottom_center=(cx, y2),  # Bottom center
             )
-            detections.append(detection)
-
-        return detections
+            for (x1, y1, x2, y2), class_id, confidence, track_id, cx, cy in zip(
+                xyxy.tolist(),
+                class_ids.astype(np.int32).tolist(),
+                confidences.astype(np.float64).tolist(),
+                track_ids.astype(np.int32).tolist(),
+                cxs.tolist(),
+                cys.tolist(),
+            )
+        ]
 
-    def draw_detections(
+    def draw_detections_inplace(
         self,
         frame: np.ndarray,
         detections: list[Detection],
@@ -143,53 +377,36 @@ class Detector:
         """
         Disegna bounding box, tracker ID e info su un frame.
 
+        Il disegno avviene direttamente sul frame (nessuna copia): il
+        chiamante deve passare un frame di cui non servono più i pixel
+        originali.
+
         Args:
-            frame: Frame BGR originale.
+            frame: Frame BGR (modificato in-place).
             detections: Lista di detection da visualizzare.
 
         Returns:
-            Frame con overlay grafico.
+            Lo stesso frame, con overlay grafico.
         """
-        overlay = frame.copy()
-
         for det in detections:
             x1, y1, x2, y2 = det.bbox
-            color = self.COLORS[det.track_id % len(self.COLORS)] if det.track_id >= 0 else (128, 128, 128)
+            color = self.COLORS[det.track_id & self._COLOR_MASK] if det.track_id >= 0 else (128, 128, 128)
 
             # Bounding box
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
 
-            # Label con sfondo
+            # Label con sfondo (sprite pre-renderizzata)
             label = f"ID:{det.track_id} {det.class_name} {det.confidence:.0%}"
-            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-            label_w, label_h = label_size
-
-            # Sfondo label
-            cv2.rectangle(
-                overlay,
-                (x1, y1 - label_h - 10),
-                (x1 + label_w + 6, y1),
-                color,
-                -1,
-            )
-            # Testo label
-            cv2.putText(
-                overlay,
-                label,
-                (x1 + 3, y1 - 5),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (255, 255, 255),
-                2,
-            )
+            sprite = _label_sprite(label, color)
+            _blit(frame, sprite, x1, y1 - sprite.shape[0] + 1)
 
             # Punto bottom_center (per ROI matching futuro)
-            cv2.circle(overlay, det.bottom_center, 5, color, -1)
+            cv2.circle(frame, det.bottom_center, 5, color, -1)
 
         # Info overlay in alto a sinistra
         info = f"Oggetti rilevati: {len(detections)}"
         cv2.putText(
-            overlay,
+            frame,
             info,
             (10, 30),
             cv2.FONT_HERSHEY_SIMPLEX,
@@ -198,4 +415,4 @@ class Detector:
             2,
         )
 
-        return overlay
+        return frame
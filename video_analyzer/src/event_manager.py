@@ -3,20 +3,23 @@ LogisticsTrack — Event Manager
 Pubblica gli eventi ROI su MQTT broker (Mosquitto).
 
 Responsabilità:
-- Converte ROIEvent in payload JSON strutturato
-- Pubblica su MQTT con QoS 1 (at least once)
+- Converte ROIEvent in payload JSON strutturato (orjson)
+- Pubblica su MQTT con QoS 1 (at least once) da un thread dedicato:
+  il loop dei frame si limita ad accodare gli eventi
 - Gestisce connessione/riconnessione al broker
 - Schema JSON versionato per compatibilità futura
 
 Il backend FastAPI sottoscrive lo stesso topic MQTT e persiste gli eventi su PostgreSQL.
 """
 
-import json
 import logging
+import queue
+import threading
 import time
 from datetime import datetime, timezone
 from typing import Optional
 
+import orjson
 import paho.mqtt.client as mqtt
 
 from config import VideoAnalyzerConfig
@@ -27,15 +30,25 @@ logger = logging.getLogger("EventManager")
 # Versione schema payload — incrementare se cambia la struttura
 PAYLOAD_SCHEMA_VERSION = "1.0"
 
+# Eventi in attesa di pubblicazione oltre i quali i nuovi vengono scartati
+PUBLISH_QUEUE_SIZE = 10000
+
+# Messaggi QoS 1 in volo (senza PUBACK) prima che paho li trattenga in coda:
+# il default di paho (20) serializza i burst di eventi sul round-trip col broker
+MQTT_MAX_INFLIGHT = 200
+
+# Sentinella di arresto del thread di pubblicazione
+_STOP = object()
+
 
 class EventManager:
     """
     Gestisce la pubblicazione di eventi ROI su MQTT.
 
     Ciclo di vita:
-    1. connect() — connessione al broker
-    2. publish_event() — chiamato dal main loop per ogni ROIEvent
-    3. disconnect() — chiusura pulita
+    1. connect() — connessione al broker e avvio thread di pubblicazione
+    2. publish_event() — chiamato dal main loop per ogni ROIEvent (solo accodamento)
+    3. disconnect() — svuota la coda e chiude
     """
 
     def __init__(self, config: VideoAnalyzerConfig) -> None:
@@ -43,6 +56,8 @@ class EventManager:
         self._client: Optional[mqtt.Client] = None
         self._connected: bool = False
         self._event_count: int = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=PUBLISH_QUEUE_SIZE)
+        self._publisher: Optional[threading.Thread] = None
 
     # -------------------------------------------------------------------
     # Connessione MQTT
@@ -62,10 +77,11 @@ class EventManager:
                 protocol=mqtt.MQTTv5,
             )
 
-            # Callbacks
+            # Callbacks (niente on_publish: un callback Python per ogni PUBACK
+            # nel thread di rete solo per un log di debug)
             self._client.on_connect = self._on_connect
             self._client.on_disconnect = self._on_disconnect
-            self._client.on_publish = self._on_publish
+            self._client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
 
             # Connessione (non bloccante con loop_start)
             logger.info(
@@ -78,6 +94,12 @@ class EventManager:
             )
             self._client.loop_start()
 
+            # Serializzazione e publish fuori dal loop dei frame
+            self._publisher = threading.Thread(
+                target=self._publish_loop, name="mqtt_publisher", daemon=True
+            )
+            self._publisher.start()
+
             # Attendi connessione (max 5 secondi)
             timeout = 5.0
             start = time.monotonic()
@@ -96,7 +118,12 @@ class EventManager:
             return False
 
     def disconnect(self) -> None:
-        """Disconnessione pulita dal broker."""
+        """Disconnessione pulita dal broker (dopo aver pubblicato gli eventi in coda)."""
+        if self._publisher is not None:
+            self._queue.put(_STOP)
+            self._publisher.join(timeout=5.0)
+            self._publisher = None
+
         if self._client:
             self._client.loop_stop()
             self._client.disconnect()
@@ -124,61 +151,43 @@ class EventManager:
         if reason_code != 0:
             logger.warning(f"MQTT: disconnessione inattesa, codice={reason_code}. Riconnessione automatica...")
 
-    def _on_publish(self, client, userdata, mid, reason_codes=None, properties=None) -> None:
-        logger.debug(f"MQTT: messaggio {mid} pubblicato con successo.")
-
     # -------------------------------------------------------------------
     # Pubblicazione eventi
     # -------------------------------------------------------------------
 
     def publish_event(self, event: ROIEvent) -> bool:
         """
-        Pubblica un singolo ROIEvent su MQTT.
+        Accoda un singolo ROIEvent per la pubblicazione su MQTT.
+
+        Non blocca: serializzazione e publish avvengono nel thread
+        di pubblicazione.
 
         Args:
             event: Evento da pubblicare.
 
         Returns:
-            True se pubblicato con successo, False altrimenti.
+            True se accodato, False se MQTT non connesso o coda piena.
         """
-        if not self._client or not self._connected:
+        if not self._client or not self._connected or self._publisher is None:
             logger.warning(f"MQTT non connesso. Evento perso: {event.event_type} track={event.track_id}")
             return False
 
-        payload = self._event_to_payload(event)
-        payload_json = json.dumps(payload, ensure_ascii=False)
-
         try:
-            result = self._client.publish(
-                topic=self.config.mqtt_topic,
-                payload=payload_json,
-                qos=1,  # At least once delivery
-            )
-
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self._event_count += 1
-                logger.debug(
-                    f"Evento pubblicato: {event.event_type} "
-                    f"track={event.track_id} roi={event.roi_id}"
-                )
-                return True
-            else:
-                logger.error(f"Errore pubblicazione MQTT: rc={result.rc}")
-                return False
-
-        except Exception as e:
-            logger.error(f"Errore pubblicazione MQTT: {e}")
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            logger.error(f"Coda pubblicazione MQTT piena. Evento perso: {event.event_type} track={event.track_id}")
             return False
 
     def publish_events(self, events: list[ROIEvent]) -> int:
         """
-        Pubblica una lista di eventi.
+        Accoda una lista di eventi.
 
         Args:
             events: Lista di ROIEvent da pubblicare.
 
         Returns:
-            Numero di eventi pubblicati con successo.
+            Numero di eventi accodati con successo.
         """
         published = 0
         for event in events:
@@ -186,6 +195,32 @@ class EventManager:
                 published += 1
         return published
 
+    def _publish_loop(self) -> None:
+        """Thread di pubblicazione: un messaggio MQTT per evento (schema 1.0)."""
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                return
+
+            try:
+                result = self._client.publish(
+                    topic=self.config.mqtt_topic,
+                    payload=orjson.dumps(self._event_to_payload(event)),
+                    qos=1,  # At least once delivery
+                )
+
+                if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                    self._event_count += 1
+                    logger.debug(
+                        f"Evento pubblicato: {event.event_type} "
+                        f"track={event.track_id} roi={event.roi_id}"
+                    )
+                else:
+                    logger.error(f"Errore pubblicazione MQTT: rc={result.rc}")
+
+            except Exception as e:
+                logger.error(f"Errore pubblicazione MQTT: {e}")
+
     # -------------------------------------------------------------------
     # Serializzazione
     # -------------------------------------------------------------------
@@ -197,11 +232,12 @@ class EventManager:
 
         Schema versionato per garantire compatibilità con il backend.
         Converte esplicitamente tipi numpy in tipi Python nativi
-        (YOLO restituisce numpy.int64/float64 non serializzabili da json.dumps).
+        (YOLO restituisce numpy.int64/float64 non serializzabili da orjson).
+        Il datetime è serializzato da orjson in ISO 8601, come isoformat().
         """
         return {
             "schema_version": PAYLOAD_SCHEMA_VERSION,
-            "timestamp": datetime.fromtimestamp(event.timestamp, tz=timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(event.timestamp, tz=timezone.utc),
             "event_type": str(event.event_type),
             "camera_id": str(event.camera_id),
             "roi_id": str(event.roi_id),
@@ -3,18 +3,26 @@ LogisticsTrack — Video Analyzer
 Entry point principale. Orchestra la pipeline:
 Video Source → YOLO Detection/Tracking → ROI Engine → MQTT Events → Display.
 
+Tre stadi concorrenti collegati da code limitate:
+- thread capture: lettura frame dalla sorgente
+- thread inferenza: detection/tracking + ROI engine
+- thread principale: pubblicazione MQTT + display (GUI OpenCV nel main thread)
+La latenza per frame è quella dello stadio più lento, non la somma.
+
 Fase 1: MVP con visualizzazione locale. ✅
 Fase 2: ROI engine + pubblicazione MQTT. ✅
 """
 
 import sys
 import time
+import queue
 import signal
 import logging
+import threading
 
 import cv2
 
-from config import VideoAnalyzerConfig
+from config import get_config
 from video_source import VideoSource
 from detector import Detector
 from roi_engine import ROIEngine
@@ -27,27 +35,187 @@ logging.basicConfig(
 )
 logger = logging.getLogger("VideoAnalyzer")
 
-# Flag per shutdown pulito
-_shutdown = False
+# Flag per shutdown pulito (condiviso dai thread della pipeline)
+_shutdown = threading.Event()
+
+# Dimensione code tra gli stadi: piccole per non accumulare latenza
+FRAME_QUEUE_SIZE = 2
+RESULT_QUEUE_SIZE = 2
+
+# Sentinella di fine stream
+_END = None
+
+# Risoluzione della miniatura per il gate di movimento
+MOTION_THUMB_SIZE = (64, 36)
 
 
 def signal_handler(sig: int, frame) -> None:
     """Gestione CTRL+C per chiusura pulita."""
-    global _shutdown
     logger.info("Ricevuto segnale di stop. Chiusura in corso...")
-    _shutdown = True
+    _shutdown.set()
 
 
 signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 
+# ---------------------------------------------------------------------------
+# Code tra gli stadi
+# ---------------------------------------------------------------------------
+
+def _put(q: queue.Queue, item) -> bool:
+    """Put bloccante, interrotto dallo shutdown. False se non inserito."""
+    while not _shutdown.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _put_latest(q: queue.Queue, item) -> None:
+    """Put non bloccante: a coda piena scarta il frame più vecchio (real-time)."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def _get(q: queue.Queue):
+    """Get bloccante, interrotto dallo shutdown (ritorna _END)."""
+    while not _shutdown.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+# ---------------------------------------------------------------------------
+# Stadi della pipeline
+# ---------------------------------------------------------------------------
+
+def _run_stage(name: str, target, *args) -> None:
+    """Esegue uno stadio in thread; un errore ferma l'intera pipeline."""
+    try:
+        target(*args)
+    except Exception as e:
+        logger.error(f"Errore critico nello stadio {name}: {e}", exc_info=True)
+        _shutdown.set()
+
+
+def capture_loop(config, video: VideoSource, frames: queue.Queue) -> None:
+    """Stadio 1: legge i frame e li passa all'inferenza."""
+    try:
+        while not _shutdown.is_set():
+            frame = video.read_frame()
+            if frame is None:
+                if config.is_file:
+                    logger.info("Video terminato.")
+                    break
+                # RTSP: la riconnessione è gestita da VideoSource
+                continue
+
+            if config.is_rtsp:
+                # Live: meglio il frame più recente che uno in ritardo
+                _put_latest(frames, frame)
+            elif not _put(frames, frame):
+                # File: nessun frame scartato
+                break
+    finally:
+        _put(frames, _END)
+
+
+def _motion_thumbnail(frame):
+    """Miniatura 64x36 in scala di grigi per il confronto tra frame."""
+    return cv2.resize(
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+        MOTION_THUMB_SIZE,
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def inference_loop(
+    config,
+    detector: Detector,
+    roi_engine: ROIEngine,
+    frames: queue.Queue,
+    results: queue.Queue,
+    reset_requested: threading.Event,
+) -> None:
+    """Stadio 2: detection/tracking a batch + ROI engine, frame per frame."""
+    # I frame sono accumulati fino a batch_size e passati al detector con
+    # una sola chiamata; il ROI engine resta frame per frame.
+    batch: list = []
+    stream_ids = [config.camera_id] * config.batch_size
+    end_of_stream = False
+
+    # Gate di movimento: un frame quasi identico all'ultimo analizzato
+    # riusa le sue detection senza passare dal modello
+    motion_gate = config.motion_threshold > 0
+    last_thumb = None
+    last_detections: list = []
+
+    def emit(frame, detections) -> bool:
+        # Reset richiesto dal display: lo stato ROI vive in questo thread
+        if reset_requested.is_set():
+            reset_requested.clear()
+            roi_engine.reset()
+
+        # ROI processing → genera eventi (anche sui frame statici: dwell)
+        events = roi_engine.process_detections(detections)
+
+        # Nessun risultato scartato: contiene gli eventi da pubblicare
+        return _put(results, (frame, detections, events))
+
+    def flush() -> bool:
+        nonlocal last_detections
+        if not batch:
+            return True
+        # Detection + Tracking (tracker dedicato per camera)
+        batch_detections = detector.detect_and_track_batch(batch, stream_ids[:len(batch)])
+        for frame, detections in zip(batch, batch_detections):
+            if not emit(frame, detections):
+                return False
+        last_detections = batch_detections[-1]
+        batch.clear()
+        return True
+
+    try:
+        while not end_of_stream:
+            frame = _get(frames)
+            if frame is _END:
+                end_of_stream = True
+            elif motion_gate:
+                thumb = _motion_thumbnail(frame)
+                if last_thumb is not None and cv2.absdiff(thumb, last_thumb).mean() < config.motion_threshold:
+                    # Scena statica: prima i frame in attesa, poi il riuso
+                    # (l'ordine temporale verso il ROI engine è preservato)
+                    if not flush() or not emit(frame, last_detections):
+                        return
+                    continue
+                last_thumb = thumb
+                batch.append(frame)
+            else:
+                batch.append(frame)
+
+            if len(batch) >= config.batch_size or end_of_stream:
+                if not flush():
+                    return
+    finally:
+        _put(results, _END)
+
+
 def main() -> None:
     """Pipeline principale del Video Analyzer."""
-    global _shutdown
-
     # 1. Configurazione
-    config = VideoAnalyzerConfig()
+    config = get_config()
     logger.info("=" * 60)
     logger.info("LogisticsTrack — Video Analyzer")
     logger.info("=" * 60)
@@ -59,18 +227,19 @@ def main() -> None:
     logger.info(f"ROI file: {config.roi_file}")
     logger.info(f"MQTT broker: {config.mqtt_broker}:{config.mqtt_port}")
     logger.info(f"Display attivo: {config.show_display}")
+    logger.info(f"Batch inferenza: {config.batch_size} frame")
     logger.info("=" * 60)
 
     # 2. Inizializzazione componenti
+    # YOLO detector (il modello si carica in background mentre si apre la sorgente)
+    detector = Detector(config)
+
     # Video source
     video = VideoSource(config)
     if not video.is_open():
         logger.error("Impossibile aprire la sorgente video. Uscita.")
         sys.exit(1)
 
-    # YOLO detector
-    detector = Detector(config)
-
     # ROI engine
     roi_engine = ROIEngine()
     roi_count = roi_engine.load_from_file(config.roi_file)
@@ -88,30 +257,41 @@ def main() -> None:
 
     # Metriche
     fps_counter = 0
-    fps_timer = time.time()
+    fps_timer = time.monotonic_ns()
     current_fps = 0.0
     total_events = 0
 
     logger.info("Pipeline avviata. Premi 'q' per uscire, 'p' per pausa, 'r' per reset ROI states.")
 
-    # 3. Loop principale
+    # 3. Avvio stadi capture e inferenza
+    frames: queue.Queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    results: queue.Queue = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+    reset_requested = threading.Event()
+
+    stages = [
+        threading.Thread(
+            target=_run_stage,
+            args=("capture", capture_loop, config, video, frames),
+            name="capture",
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_run_stage,
+            args=("inferenza", inference_loop, config, detector, roi_engine, frames, results, reset_requested),
+            name="inference",
+            daemon=True,
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+
+    # 4. Stadio 3 (thread principale): eventi MQTT + display
     try:
-        while not _shutdown:
-            # Leggi frame
-            frame = video.read_frame()
-            if frame is None:
-                if config.is_file:
-                    logger.info("Video terminato.")
-                    break
-                else:
-                    # RTSP: la riconnessione è gestita da VideoSource
-                    continue
-
-            # Detection + Tracking
-            detections = detector.detect_and_track(frame)
-
-            # ROI processing → genera eventi
-            events = roi_engine.process_detections(detections)
+        while True:
+            item = _get(results)
+            if item is _END:
+                break
+            frame, detections, events = item
 
             # Pubblica eventi su MQTT
             if events:
@@ -128,15 +308,16 @@ def main() -> None:
 
             # Calcolo FPS reali
             fps_counter += 1
-            elapsed = time.time() - fps_timer
-            if elapsed >= 1.0:
-                current_fps = fps_counter / elapsed
+            now = time.monotonic_ns()
+            elapsed_ns = now - fps_timer
+            if elapsed_ns >= 1_000_000_000:
+                current_fps = fps_counter * 1e9 / elapsed_ns
                 fps_counter = 0
-                fps_timer = time.time()
+                fps_timer = now
 
             # Visualizzazione
             if config.show_display:
-                display_frame = detector.draw_detections(frame, detections)
+                display_frame = detector.draw_detections_inplace(frame, detections)
 
                 # Disegna ROI overlay
                 if roi_count > 0:
@@ -188,7 +369,7 @@ def main() -> None:
                     logger.info("PAUSA — Premi qualsiasi tasto per continuare.")
                     cv2.waitKey(0)
                 elif key == ord("r"):
-                    roi_engine.reset()
+                    reset_requested.set()
                     total_events = 0
                     logger.info("Stati ROI resettati manualmente.")
 
@@ -196,6 +377,11 @@ def main() -> None:
         logger.error(f"Errore critico nella pipeline: {e}", exc_info=True)
 
     finally:
+        # Ferma gli stadi prima di rilasciare le risorse che usano
+        _shutdown.set()
+        for stage in stages:
+            stage.join(timeout=5.0)
+
         # Cleanup
         event_manager.disconnect()
         video.release()
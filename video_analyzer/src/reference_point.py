@@ -5,7 +5,9 @@ Il punto scelto determina quando un oggetto è "dentro" o "fuori" da una ROI.
 """
 
 from enum import Enum
-from typing import Tuple
+from typing import Callable, Tuple
+
+import numpy as np
 
 
 class ReferencePoint(Enum):
@@ -15,6 +17,50 @@ class ReferencePoint(Enum):
     TOP_CENTER = "top_center"         # Testa / punto alto (camere inclinate dall'alto)
 
 
+# ---------------------------------------------------------------------------
+# Tabelle di dispatch: strategia → funzione, risolte con un solo lookup
+# ---------------------------------------------------------------------------
+
+def _bottom_center(bbox: Tuple[int, int, int, int]) -> Tuple[float, float]:
+    return ((bbox[0] + bbox[2]) / 2.0, float(bbox[3]))
+
+
+def _top_center(bbox: Tuple[int, int, int, int]) -> Tuple[float, float]:
+    return ((bbox[0] + bbox[2]) / 2.0, float(bbox[1]))
+
+
+def _centroid(bbox: Tuple[int, int, int, int]) -> Tuple[float, float]:
+    return ((bbox[0] + bbox[2]) / 2.0, (bbox[1] + bbox[3]) / 2.0)
+
+
+def _bottom_center_vec(bboxes: np.ndarray) -> np.ndarray:
+    return np.stack(((bboxes[:, 0] + bboxes[:, 2]) / 2.0, bboxes[:, 3]), axis=1)
+
+
+def _top_center_vec(bboxes: np.ndarray) -> np.ndarray:
+    return np.stack(((bboxes[:, 0] + bboxes[:, 2]) / 2.0, bboxes[:, 1]), axis=1)
+
+
+def _centroid_vec(bboxes: np.ndarray) -> np.ndarray:
+    return np.stack(
+        ((bboxes[:, 0] + bboxes[:, 2]) / 2.0, (bboxes[:, 1] + bboxes[:, 3]) / 2.0),
+        axis=1,
+    )
+
+
+_DISPATCH: dict[ReferencePoint, Callable[[Tuple[int, int, int, int]], Tuple[float, float]]] = {
+    ReferencePoint.BOTTOM_CENTER: _bottom_center,
+    ReferencePoint.TOP_CENTER: _top_center,
+    ReferencePoint.CENTROID: _centroid,
+}
+
+_DISPATCH_VEC: dict[ReferencePoint, Callable[[np.ndarray], np.ndarray]] = {
+    ReferencePoint.BOTTOM_CENTER: _bottom_center_vec,
+    ReferencePoint.TOP_CENTER: _top_center_vec,
+    ReferencePoint.CENTROID: _centroid_vec,
+}
+
+
 def compute_reference_point(
     bbox: Tuple[int, int, int, int],
     strategy: ReferencePoint = ReferencePoint.BOTTOM_CENTER
@@ -29,16 +75,24 @@ def compute_reference_point(
     Returns:
         (x, y) coordinate del punto di riferimento
     """
-    x1, y1, x2, y2 = bbox
-    cx = (x1 + x2) / 2.0
-
-    if strategy == ReferencePoint.BOTTOM_CENTER:
-        return (cx, float(y2))
-    elif strategy == ReferencePoint.TOP_CENTER:
-        return (cx, float(y1))
-    elif strategy == ReferencePoint.CENTROID:
-        cy = (y1 + y2) / 2.0
-        return (cx, cy)
-    else:
-        # Fallback sicuro
-        return (cx, float(y2))
+    # Strategia sconosciuta → BOTTOM_CENTER (fallback sicuro)
+    return _DISPATCH.get(strategy, _bottom_center)(bbox)
+
+
+def compute_reference_points(
+    bboxes: np.ndarray,
+    strategy: ReferencePoint = ReferencePoint.BOTTOM_CENTER
+) -> np.ndarray:
+    """
+    Versione vettoriale di compute_reference_point per N bounding box.
+
+    Args:
+        bboxes: array (N, 4) di (x1, y1, x2, y2)
+        strategy: quale punto del bbox usare
+
+    Returns:
+        array (N, 2) float64 di coordinate (x, y), stessi valori della
+        versione scalare
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    return _DISPATCH_VEC.get(strategy, _bottom_center_vec)(bboxes)
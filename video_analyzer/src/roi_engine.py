@@ -21,14 +21,86 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
-from shapely.geometry import Point, Polygon
+import cv2
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
 
 from detector import Detection
-from reference_point import ReferencePoint, compute_reference_point
+from reference_point import ReferencePoint, compute_reference_points
+from roi_kernel import NUMBA_AVAILABLE, pack_edges, polygon_edges
+
+if NUMBA_AVAILABLE:
+    from roi_kernel import points_in_polygons
 
 logger = logging.getLogger("ROIEngine")
 
 
+# ---------------------------------------------------------------------------
+# Validazione rapida dei poligoni
+# ---------------------------------------------------------------------------
+
+def _cross(o: tuple[float, float], a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Prodotto vettoriale (a - o) × (b - o): segno = orientamento della terna."""
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _on_segment(p: tuple[float, float], a: tuple[float, float], b: tuple[float, float]) -> bool:
+    """True se p (collineare con a-b) cade nel rettangolo del segmento a-b."""
+    return min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[1] <= max(a[1], b[1])
+
+
+def _segments_touch(a, b, c, d) -> bool:
+    """True se i segmenti a-b e c-d si intersecano o si toccano (estremi inclusi)."""
+    d1, d2 = _cross(c, d, a), _cross(c, d, b)
+    d3, d4 = _cross(a, b, c), _cross(a, b, d)
+    if ((d1 > 0) != (d2 > 0)) and d1 != 0 and d2 != 0 and ((d3 > 0) != (d4 > 0)) and d3 != 0 and d4 != 0:
+        return True
+    return (
+        (d1 == 0 and _on_segment(a, c, d))
+        or (d2 == 0 and _on_segment(b, c, d))
+        or (d3 == 0 and _on_segment(c, a, b))
+        or (d4 == 0 and _on_segment(d, a, b))
+    )
+
+
+def _is_simple_polygon(points: list[tuple[float, float]]) -> bool:
+    """
+    Verifica rapida in Python puro: area (shoelace) non nulla, nessun lato
+    degenere e lati non adiacenti che non si toccano. Un poligono che la
+    supera è valido anche per GEOS; False significa solo "da verificare"
+    con Shapely (is_valid), non necessariamente non valido.
+    """
+    pts = [(float(x), float(y)) for x, y in points]
+    n = len(pts)
+    edges = list(zip(pts, pts[1:] + pts[:1]))
+
+    if sum(a[0] * b[1] - b[0] * a[1] for a, b in edges) == 0:
+        return False
+
+    for i in range(n):
+        a, b = edges[i]
+        if a == b:
+            return False
+        for j in range(i + 1, n):
+            c, d = edges[j]
+            if j == i + 1 or (i == 0 and j == n - 1):
+                # Lati adiacenti: condividono un vertice, errore solo se
+                # collineari e tornano indietro (spike)
+                p, q, r = (a, b, d) if j == i + 1 else (c, a, b)
+                if _cross(p, q, r) == 0 and (q[0] - p[0]) * (r[0] - q[0]) + (q[1] - p[1]) * (r[1] - q[1]) < 0:
+                    return False
+                continue
+            if _segments_touch(a, b, c, d):
+                return False
+    return True
+
+
+def _rects_overlap(a: tuple[int, int, int, int], b: tuple[int, int, int, int]) -> bool:
+    """True se due rettangoli (x, y, w, h) si sovrappongono."""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
 # ---------------------------------------------------------------------------
 # Data classes
 # ---------------------------------------------------------------------------
@@ -43,7 +115,7 @@ class ROIDefinition:
     points: list[tuple[float, float]]           # Vertici poligono [(x,y), ...] in pixel
     reference_point: ReferencePoint = ReferencePoint.BOTTOM_CENTER
     parent_id: Optional[str] = None             # ROI padre (gerarchia)
-    is_active: bool = True                      # Abilitata/disabilitata
+    is_active: bool = True                      # Abilitata/disabilitata (a runtime: ROIEngine.set_active)
     color: tuple[int, int, int] = (0, 255, 0)  # Colore overlay BGR
 
     def __post_init__(self) -> None:
@@ -51,16 +123,54 @@ class ROIDefinition:
         if len(self.points) < 3:
             raise ValueError(f"ROI '{self.id}': servono almeno 3 punti, trovati {len(self.points)}")
         self._polygon = Polygon(self.points)
-        if not self._polygon.is_valid:
+        # is_valid (GEOS) solo se la verifica rapida non basta (es. lati che si incrociano)
+        if not _is_simple_polygon(self.points) and not self._polygon.is_valid:
             logger.warning(f"ROI '{self.id}': poligono non valido, applico buffer(0) per correggere")
             self._polygon = self._polygon.buffer(0)
+        # Lati e rettangolo di ingombro (dopo l'eventuale correzione) per il kernel PNPOLY
+        self._edges = polygon_edges(self._polygon)
+        self._bounds = self._polygon.bounds
+        # Indice GEOS precalcolato: contains/contains_xy ripetuti più veloci
+        shapely.prepare(self._polygon)
+        # Geometria per il disegno (immutabile dopo il caricamento)
+        self._pixel_points = np.asarray(self.points, dtype=np.int32)
+        x_min, y_min = self._pixel_points.min(axis=0).tolist()
+        x_max, y_max = self._pixel_points.max(axis=0).tolist()
+        self._bounding_rect = (x_min, y_min, x_max - x_min + 1, y_max - y_min + 1)
+        self._label_size: Optional[tuple[int, int]] = None
 
     @property
     def polygon(self) -> Polygon:
         return self._polygon
 
+    @property
+    def edges(self) -> np.ndarray:
+        return self._edges
 
-@dataclass
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        """Rettangolo di ingombro (minx, miny, maxx, maxy)."""
+        return self._bounds
+
+    @property
+    def pixel_points(self) -> np.ndarray:
+        """Vertici in pixel interi (int32), pronti per cv2.fillPoly/polylines."""
+        return self._pixel_points
+
+    @property
+    def bounding_rect(self) -> tuple[int, int, int, int]:
+        """(x, y, w, h) come cv2.boundingRect dei vertici in pixel."""
+        return self._bounding_rect
+
+    @property
+    def label_size(self) -> tuple[int, int]:
+        """Dimensioni (w, h) della label col solo nome, calcolate al primo disegno."""
+        if self._label_size is None:
+            self._label_size = cv2.getTextSize(self.name, cv2.FONT_HERSHEY_SIMPLEX, 0.55, 2)[0]
+        return self._label_size
+
+
+@dataclass(slots=True)
 class TrackState:
     """Stato di un singolo tracker rispetto a una ROI."""
     track_id: int
@@ -97,6 +207,17 @@ class ROIEvent:
     parent_roi_id: Optional[str] = None
 
 
+@dataclass
+class _ROIGroup:
+    """ROI attive con la stessa strategia di punto di riferimento, pronte per il kernel."""
+    strategy: ReferencePoint
+    cols: list[int]          # Indici nella lista delle ROI attive
+    edges: np.ndarray        # Lati concatenati (E, 4)
+    offsets: np.ndarray      # Offset dei lati per ROI (M+1,)
+    bounds: np.ndarray       # Rettangoli di ingombro (M, 4)
+    polygons: list[Polygon]  # Poligoni (preparati) per il percorso senza Numba
+
+
 # ---------------------------------------------------------------------------
 # ROI Engine
 # ---------------------------------------------------------------------------
@@ -109,7 +230,13 @@ class ROIEngine:
 
     def __init__(self) -> None:
         self._rois: dict[str, ROIDefinition] = {}           # roi_id → ROIDefinition
-        self._track_states: dict[str, TrackState] = {}      # "track_id:roi_id" → TrackState
+        # Solo gli stati "dentro": un track fuori da una ROI non ha stato
+        self._track_states: dict[tuple[int, str], TrackState] = {}  # (track_id, roi_id) → TrackState
+        self._inside_rois: dict[int, set[str]] = {}         # track_id → ROI in cui è dentro
+        # ROI attive, loro gruppi per strategia e colonna di ogni roi_id:
+        # ricostruiti solo quando cambiano le ROI o il loro stato attivo
+        # (None = da ricostruire, vedi _invalidate_active)
+        self._active: Optional[tuple[list[ROIDefinition], list[_ROIGroup], dict[str, int]]] = None
         self._dwell_thresholds: dict[str, float] = {}       # roi_id → soglia dwell in secondi
 
     # -------------------------------------------------------------------
@@ -197,6 +324,7 @@ class ROIEngine:
             except (KeyError, ValueError) as e:
                 logger.error(f"Errore nel caricamento ROI: {e}")
 
+        self._invalidate_active()
         logger.info(f"Totale ROI caricate: {loaded}/{len(rois_data)}")
         return loaded
 
@@ -205,6 +333,23 @@ class ROIEngine:
         self._rois[roi.id] = roi
         if dwell_threshold_sec > 0:
             self._dwell_thresholds[roi.id] = dwell_threshold_sec
+        self._invalidate_active()
+
+    def set_active(self, roi_id: str, active: bool) -> bool:
+        """
+        Abilita/disabilita una ROI a runtime.
+
+        Da usare al posto di assegnare roi.is_active: aggiorna la cache
+        delle ROI attive. Ritorna False se la ROI non esiste.
+        """
+        roi = self._rois.get(roi_id)
+        if roi is None:
+            return False
+        if roi.is_active != active:
+            roi.is_active = active
+            self._invalidate_active()
+            logger.info(f"ROI '{roi.name}' ({roi.id}) {'attivata' if active else 'disattivata'}")
+        return True
 
     @property
     def roi_count(self) -> int:
@@ -212,7 +357,31 @@ class ROIEngine:
 
     @property
     def active_rois(self) -> list[ROIDefinition]:
-        return [r for r in self._rois.values() if r.is_active]
+        """ROI attive, nell'ordine di caricamento (lista in cache: non modificarla)."""
+        return self._active_groups()[0]
+
+    def _invalidate_active(self) -> None:
+        """Forza la ricostruzione della cache delle ROI attive."""
+        self._active = None
+
+    def _active_groups(self) -> tuple[list[ROIDefinition], list[_ROIGroup], dict[str, int]]:
+        """ROI attive, loro gruppi per strategia e colonne per roi_id (in cache)."""
+        if self._active is None:
+            rois = [r for r in self._rois.values() if r.is_active]
+            by_strategy: dict[ReferencePoint, list[int]] = {}
+            for j, roi in enumerate(rois):
+                by_strategy.setdefault(roi.reference_point, []).append(j)
+
+            groups = []
+            for strategy, cols in by_strategy.items():
+                edges, offsets = pack_edges([rois[j].edges for j in cols])
+                bounds = np.array([rois[j].bounds for j in cols], dtype=np.float64)
+                polygons = [rois[j].polygon for j in cols]
+                groups.append(_ROIGroup(strategy, cols, edges, offsets, bounds, polygons))
+
+            roi_cols = {roi.id: j for j, roi in enumerate(rois)}
+            self._active = (rois, groups, roi_cols)
+        return self._active
 
     def get_children(self, parent_id: str) -> list[ROIDefinition]:
         """Ritorna le ROI figlie di un parent."""
@@ -222,15 +391,14 @@ class ROIEngine:
     # Logica di intersezione
     # -------------------------------------------------------------------
 
-    def _state_key(self, track_id: int, roi_id: str) -> str:
-        return f"{track_id}:{roi_id}"
-
-    def _get_state(self, track_id: int, roi_id: str) -> TrackState:
-        """Ritorna o crea lo stato per un track_id in una ROI."""
-        key = self._state_key(track_id, roi_id)
-        if key not in self._track_states:
-            self._track_states[key] = TrackState(track_id=track_id, roi_id=roi_id)
-        return self._track_states[key]
+    def _drop_state(self, track_id: int, roi_id: str) -> None:
+        """Rimuove lo stato di un track uscito da una ROI."""
+        self._track_states.pop((track_id, roi_id), None)
+        rois = self._inside_rois.get(track_id)
+        if rois is not None:
+            rois.discard(roi_id)
+            if not rois:
+                del self._inside_rois[track_id]
 
     def process_detections(self, detections: list[Detection]) -> list[ROIEvent]:
         """
@@ -255,23 +423,51 @@ class ROIEngine:
         # Set dei track_id visti in questo frame (per gestire uscite)
         seen_track_ids: set[int] = set()
 
-        for det in detections:
-            # Ignora detection senza tracking
-            if det.track_id < 0:
-                continue
-
-            seen_track_ids.add(det.track_id)
-
-            for roi in self.active_rois:
-                # Calcola il punto di riferimento secondo la strategia della ROI
-                ref_point = compute_reference_point(det.bbox, roi.reference_point)
-                point = Point(ref_point)
-
-                is_inside = roi.polygon.contains(point)
-                state = self._get_state(det.track_id, roi.id)
-
-                if is_inside and not state.is_inside:
+        # Ignora detection senza tracking
+        tracked = [det for det in detections if det.track_id >= 0]
+        active_rois, groups, roi_cols = self._active_groups()
+
+        # Appartenenza detection × ROI calcolata prima del loop sugli stati
+        hits = self._roi_hits(tracked, len(active_rois), groups)
+
+        # Metodi legati a variabili locali: il loop interno gira per ogni
+        # coppia detection × ROI candidata
+        states = self._track_states
+        states_get = states.get
+        inside_rois_get = self._inside_rois.get
+        inside_rois_setdefault = self._inside_rois.setdefault
+        thresholds_get = self._dwell_thresholds.get
+        append_event = events.append
+        seen_add = seen_track_ids.add
+
+        for i, det in enumerate(tracked):
+            tid = det.track_id
+            seen_add(tid)
+
+            # ROI da valutare: quelle che contengono il punto e quelle in cui
+            # il track era dentro (possibili uscite); per le altre lo stato
+            # non cambia. Ordine delle ROI attive, come il loop completo.
+            hit_cols = hits[i]
+            was_in = inside_rois_get(tid)
+            if was_in:
+                cols = sorted(set(hit_cols).union(roi_cols[r] for r in was_in if r in roi_cols))
+            else:
+                cols = hit_cols
+
+            for j in cols:
+                roi = active_rois[j]
+                rid = roi.id
+                is_inside = j in hit_cols
+                # Un solo lookup per coppia: lo stato esiste solo se dentro
+                key = (tid, rid)
+                state = states_get(key)
+                was_inside = state is not None and state.is_inside
+
+                if is_inside and not was_inside:
                     # === INGRESSO nella ROI ===
+                    if state is None:
+                        state = states[key] = TrackState(track_id=tid, roi_id=rid)
+                        inside_rois_setdefault(tid, set()).add(rid)
                     state.is_inside = True
                     state.entered_at = now
                     state.last_seen_at = now
@@ -280,43 +476,43 @@ class ROIEngine:
 
                     event = ROIEvent(
                         event_type="roi_enter",
-                        roi_id=roi.id,
+                        roi_id=rid,
                         roi_name=roi.name,
                         aisle_id=roi.aisle_id,
                         camera_id=roi.camera_id,
-                        track_id=det.track_id,
+                        track_id=tid,
                         confidence=det.confidence,
                         bbox=det.bbox,
                         reference_point_used=roi.reference_point.value,
                         timestamp=now_epoch,
                         parent_roi_id=roi.parent_id,
                     )
-                    events.append(event)
+                    append_event(event)
                     logger.info(
-                        f"ENTER: track_id={det.track_id} → ROI '{roi.name}' "
+                        f"ENTER: track_id={tid} → ROI '{roi.name}' "
                         f"(aisle={roi.aisle_id})"
                     )
 
-                elif is_inside and state.is_inside:
+                elif is_inside and was_inside:
                     # === PERMANENZA nella ROI ===
                     state.last_seen_at = now
                     state.confidence = det.confidence
                     state.bbox = det.bbox
 
                     # Check soglia dwell
-                    if roi.id in self._dwell_thresholds:
-                        threshold = self._dwell_thresholds[roi.id]
+                    threshold = thresholds_get(rid)
+                    if threshold is not None:
                         dwell = state.dwell_seconds
                         # Genera evento dwell solo quando supera la soglia
                         # (con tolleranza di 1 frame per non generare duplicati)
                         if dwell >= threshold and (dwell - threshold) < 0.2:
                             event = ROIEvent(
                                 event_type="dwell_time",
-                                roi_id=roi.id,
+                                roi_id=rid,
                                 roi_name=roi.name,
                                 aisle_id=roi.aisle_id,
                                 camera_id=roi.camera_id,
-                                track_id=det.track_id,
+                                track_id=tid,
                                 confidence=det.confidence,
                                 bbox=det.bbox,
                                 reference_point_used=roi.reference_point.value,
@@ -324,24 +520,24 @@ class ROIEngine:
                                 dwell_seconds=dwell,
                                 parent_roi_id=roi.parent_id,
                             )
-                            events.append(event)
+                            append_event(event)
                             logger.info(
-                                f"DWELL: track_id={det.track_id} in ROI '{roi.name}' "
+                                f"DWELL: track_id={tid} in ROI '{roi.name}' "
                                 f"per {dwell:.1f}s (soglia: {threshold}s)"
                             )
 
-                elif not is_inside and state.is_inside:
+                elif not is_inside and was_inside:
                     # === USCITA dalla ROI ===
                     dwell = state.dwell_seconds
                     state.is_inside = False
 
                     event = ROIEvent(
                         event_type="roi_exit",
-                        roi_id=roi.id,
+                        roi_id=rid,
                         roi_name=roi.name,
                         aisle_id=roi.aisle_id,
                         camera_id=roi.camera_id,
-                        track_id=det.track_id,
+                        track_id=tid,
                         confidence=det.confidence,
                         bbox=det.bbox,
                         reference_point_used=roi.reference_point.value,
@@ -349,15 +545,14 @@ class ROIEngine:
                         dwell_seconds=dwell,
                         parent_roi_id=roi.parent_id,
                     )
-                    events.append(event)
+                    append_event(event)
                     logger.info(
-                        f"EXIT: track_id={det.track_id} ← ROI '{roi.name}' "
+                        f"EXIT: track_id={tid} ← ROI '{roi.name}' "
                         f"(dwell={dwell:.1f}s)"
                     )
 
                     # Reset stato
-                    state.entered_at = None
-                    state.last_seen_at = None
+                    self._drop_state(tid, rid)
 
         # Gestione track_id che non compaiono più (persi dal tracker)
         # Genera uscite per tutti i track che erano dentro una ROI
@@ -367,6 +562,56 @@ class ROIEngine:
 
         return events
 
+    @staticmethod
+    def _roi_hits(
+        tracked: list[Detection],
+        roi_count: int,
+        groups: list[_ROIGroup],
+    ) -> list[list[int]]:
+        """
+        Per ogni detection, gli indici (in ordine) delle ROI attive che
+        contengono il suo punto di riferimento secondo la strategia della ROI.
+
+        Il punto di riferimento è calcolato una volta per strategia usata
+        (non per ROI). Test punto-in-poligono: con Numba una sola chiamata
+        al kernel PNPOLY per gruppo, altrimenti shapely.contains_xy una
+        volta per ROI su tutti i punti. In nessun caso Point Shapely o
+        chiamate GEOS per coppia detection × ROI.
+        """
+        hits: list[list[int]] = [[] for _ in tracked]
+        if not tracked or not roi_count:
+            return hits
+
+        bboxes = np.array([det.bbox for det in tracked], dtype=np.float64)
+
+        if len(groups) == 1:
+            # Caso comune: tutte le ROI con la stessa strategia. Il gruppo ha
+            # le colonne 0..M-1 in ordine: la sua matrice è già quella finale
+            inside = ROIEngine._group_inside(bboxes, groups[0])
+        else:
+            inside = np.zeros((len(tracked), roi_count), dtype=bool)
+            for group in groups:
+                inside[:, group.cols] = ROIEngine._group_inside(bboxes, group)
+
+        # Matrice sparsa: in genere un punto cade in 0-2 ROI
+        rows, cols = np.nonzero(inside)
+        for i, j in zip(rows.tolist(), cols.tolist()):
+            hits[i].append(j)
+        return hits
+
+    @staticmethod
+    def _group_inside(bboxes: np.ndarray, group: _ROIGroup) -> np.ndarray:
+        """Matrice (N, len(group.cols)) di appartenenza per un gruppo di ROI."""
+        points = compute_reference_points(bboxes, group.strategy)
+        if NUMBA_AVAILABLE:
+            return points_in_polygons(points, group.edges, group.offsets, group.bounds)
+
+        inside = np.empty((len(points), len(group.cols)), dtype=bool)
+        xs, ys = points[:, 0], points[:, 1]
+        for k, polygon in enumerate(group.polygons):
+            inside[:, k] = shapely.contains_xy(polygon, xs, ys)
+        return inside
+
     def _handle_lost_tracks(
         self,
         seen_track_ids: set[int],
@@ -380,6 +625,13 @@ class ROIEngine:
         prima di considerarlo "perso". Questo evita falsi exit per frame drop.
         """
         events: list[ROIEvent] = []
+
+        # Track dentro qualche ROI ma assenti in questo frame: nel caso
+        # comune (nessuno dentro, o tutti visibili) nessuna scansione
+        unseen = self._inside_rois.keys() - seen_track_ids
+        if not unseen:
+            return events
+
         now = time.monotonic()
         lost_tolerance_sec = 1.0  # Tolleranza prima di dichiarare uscita
 
@@ -389,7 +641,7 @@ class ROIEngine:
             if not state.is_inside:
                 continue
 
-            if state.track_id in seen_track_ids:
+            if state.track_id not in unseen:
                 continue
 
             # Track non visto — verifica tolleranza
@@ -431,7 +683,8 @@ class ROIEngine:
 
         # Pulizia stati orfani
         for key in keys_to_cleanup:
-            del self._track_states[key]
+            state = self._track_states[key]
+            self._drop_state(state.track_id, state.roi_id)
 
         return events
 
@@ -447,58 +700,88 @@ class ROIEngine:
             frame: Frame BGR (modificato in-place).
             detections: Se fornite, evidenzia le ROI che contengono almeno un tracker.
         """
-        import cv2
-        import numpy as np
-
-        overlay = frame.copy()
-
+        # Stato di ogni ROI (evidenziata se c'è almeno un tracker dentro)
+        styled = []
         for roi in self.active_rois:
-            pts = np.array(roi.points, dtype=np.int32)
-            color = roi.color
-
-            # Verifica se qualche tracker è dentro questa ROI
-            has_tracker_inside = False
+            inside_state = None
             if detections:
                 for det in detections:
                     if det.track_id < 0:
                         continue
-                    state = self._track_states.get(self._state_key(det.track_id, roi.id))
+                    state = self._track_states.get((det.track_id, roi.id))
                     if state and state.is_inside:
-                        has_tracker_inside = True
+                        inside_state = state
                         break
 
-            # Riempimento semi-trasparente
-            fill_color = (0, 0, 255) if has_tracker_inside else color
-            alpha = 0.25 if has_tracker_inside else 0.12
-            cv2.fillPoly(overlay, [pts], fill_color)
-
-            # Bordo
-            border_color = (0, 0, 255) if has_tracker_inside else color
-            border_thickness = 3 if has_tracker_inside else 2
-            cv2.polylines(frame, [pts], isClosed=True, color=border_color, thickness=border_thickness)
-
-            # Label ROI
-            # Posiziona in alto-sinistra del bounding rect del poligono
-            bx, by, bw, bh = cv2.boundingRect(pts)
-            label = f"{roi.name}"
-            if has_tracker_inside:
+            color = (0, 0, 255) if inside_state else roi.color
+            thickness = 3 if inside_state else 2
+            if inside_state:
                 # Mostra dwell time del primo tracker dentro
-                for det in (detections or []):
-                    if det.track_id < 0:
-                        continue
-                    state = self._track_states.get(self._state_key(det.track_id, roi.id))
-                    if state and state.is_inside:
-                        label += f" [{state.dwell_seconds:.1f}s]"
-                        break
-
-            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.55, 2)
-            lw, lh = label_size
-            cv2.rectangle(frame, (bx, by - lh - 8), (bx + lw + 6, by), border_color, -1)
+                label = f"{roi.name} [{inside_state.dwell_seconds:.1f}s]"
+                label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.55, 2)[0]
+            else:
+                label = roi.name
+                label_size = roi.label_size
+            styled.append((roi, label, label_size, color, thickness))
+
+        if not styled:
+            return
+
+        # Regione toccata dal disegno: rettangoli delle ROI allargati dello
+        # spessore del bordo, più le label sopra di essi. Fuori da qui il
+        # blend lascerebbe i pixel invariati: copia e blend solo su questa
+        # regione invece che sull'intero frame
+        frame_h, frame_w = frame.shape[:2]
+        x0, y0, x1, y1 = frame_w, frame_h, 0, 0
+        for roi, _, (lw, lh), _, thickness in styled:
+            bx, by, bw, bh = roi.bounding_rect
+            x0 = min(x0, bx - thickness)
+            y0 = min(y0, by - thickness, by - lh - 8)
+            x1 = max(x1, bx + bw + thickness, bx + lw + 7)
+            y1 = max(y1, by + bh + thickness)
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, frame_w), min(y1, frame_h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        region = frame[y0:y1, x0:x1]
+        overlay = region.copy()
+
+        # Riempimento semi-trasparente: una fillPoly per gruppo di ROI
+        # consecutive con lo stesso colore e rettangoli disgiunti (con più
+        # contorni fillPoly applica la regola pari/dispari: le ROI
+        # sovrapposte restano in chiamate separate, nell'ordine originale)
+        fill_batches: list[tuple[tuple[int, int, int], list, list]] = []
+        for roi, _, _, color, _ in styled:
+            batch = fill_batches[-1] if fill_batches else None
+            if batch and batch[0] == color and not any(
+                _rects_overlap(roi.bounding_rect, rect) for rect in batch[2]
+            ):
+                batch[1].append(roi.pixel_points)
+                batch[2].append(roi.bounding_rect)
+            else:
+                fill_batches.append((color, [roi.pixel_points], [roi.bounding_rect]))
+        for color, polys, _ in fill_batches:
+            cv2.fillPoly(overlay, polys, color, offset=(-x0, -y0))
+
+        # Bordi: una polylines per gruppo consecutivo con stesso colore e spessore
+        border_batches: list[tuple[tuple[int, int, int], int, list]] = []
+        for roi, _, _, color, thickness in styled:
+            if border_batches and border_batches[-1][:2] == (color, thickness):
+                border_batches[-1][2].append(roi.pixel_points)
+            else:
+                border_batches.append((color, thickness, [roi.pixel_points]))
+        for color, thickness, polys in border_batches:
+            cv2.polylines(frame, polys, isClosed=True, color=color, thickness=thickness)
+
+        # Label ROI, sopra tutti i bordi
+        # Posiziona in alto-sinistra del bounding rect del poligono
+        for roi, label, (lw, lh), color, _ in styled:
+            bx, by, bw, bh = roi.bounding_rect
+            cv2.rectangle(frame, (bx, by - lh - 8), (bx + lw + 6, by), color, -1)
             cv2.putText(frame, label, (bx + 3, by - 4), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 255, 255), 2)
 
-        # Blend overlay
-        import cv2 as _cv2
-        _cv2.addWeighted(overlay, 0.3, frame, 0.7, 0, frame)
+        # Blend overlay (region è una vista sul frame: scrittura in-place)
+        cv2.addWeighted(overlay, 0.3, region, 0.7, 0, region)
 
     # -------------------------------------------------------------------
     # Cleanup
@@ -507,11 +790,14 @@ class ROIEngine:
     def reset(self) -> None:
         """Reset completo degli stati di tracking (non delle ROI)."""
         self._track_states.clear()
+        self._inside_rois.clear()
         logger.info("Stati tracking ROI resettati.")
 
     def clear_all(self) -> None:
         """Rimuove tutte le ROI e gli stati."""
         self._rois.clear()
         self._track_states.clear()
+        self._inside_rois.clear()
         self._dwell_thresholds.clear()
+        self._invalidate_active()
         logger.info("Tutte le ROI e gli stati rimossi.")
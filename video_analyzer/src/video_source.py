@@ -2,10 +2,16 @@
 LogisticsTrack — Video Source Manager
 Gestisce l'acquisizione frame da file MP4 o stream RTSP.
 Include riconnessione automatica per stream RTSP.
+
+Per RTSP un thread dedicato legge e decodifica di continuo e tiene solo
+l'ultimo frame: la latenza di rete/decodifica non si somma a quella
+dell'analisi e i frame vecchi non si accumulano.
 """
 
+import os
 import time
 import logging
+import threading
 import cv2
 import numpy as np
 
@@ -13,6 +19,24 @@ from config import VideoAnalyzerConfig
 
 logger = logging.getLogger("VideoSource")
 
+# Opzioni FFmpeg per RTSP: trasporto TCP (niente pacchetti UDP persi →
+# meno frame corrotti e riconnessioni). Va impostata prima della prima
+# VideoCapture; un valore già presente nell'ambiente ha la precedenza.
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+# Attesa massima di un nuovo frame RTSP in read_frame (secondi)
+FRAME_WAIT_TIMEOUT = 1.0
+
+# Attesa massima della chiusura del thread di lettura in release (secondi).
+# Scaduta l'attesa il thread resta bloccato in cap.read() al massimo fino
+# a RTSP_READ_TIMEOUT_MSEC e poi rilascia da sé la propria capture.
+READER_JOIN_TIMEOUT = 2.0
+
+# Timeout di apertura e lettura della capture RTSP (ms): uno stream fermo
+# fa fallire cap.read() (→ riconnessione) invece di bloccarlo a lungo
+RTSP_OPEN_TIMEOUT_MSEC = 10000
+RTSP_READ_TIMEOUT_MSEC = 5000
+
 
 class VideoSource:
     """Sorgente video unificata per file e stream RTSP."""
@@ -20,6 +44,16 @@ class VideoSource:
     def __init__(self, config: VideoAnalyzerConfig) -> None:
         self.config = config
         self.cap: cv2.VideoCapture | None = None
+
+        # Thread di lettura RTSP e ultimo frame decodificato
+        self._reader: threading.Thread | None = None
+        self._reader_stop = threading.Event()
+        self._frame_cond = threading.Condition()
+        self._latest_frame: np.ndarray | None = None
+        self._latest_seq = 0
+        self._read_seq = 0
+        self._reader_failed = False
+
         self._connect()
 
     def _connect(self) -> bool:
@@ -29,7 +63,17 @@ class VideoSource:
 
         if self.config.is_rtsp:
             # Per RTSP usiamo FFMPEG backend e buffer minimo
-            self.cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+            params = [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, RTSP_OPEN_TIMEOUT_MSEC,
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, RTSP_READ_TIMEOUT_MSEC,
+            ]
+            if self.config.rtsp_hw_decode:
+                # Decoder hardware se disponibile (CUDA/VAAPI/D3D11...),
+                # altrimenti OpenCV ripiega sulla decodifica CPU. Nessun
+                # CAP_PROP_HW_DEVICE: con ACCELERATION_ANY OpenCV rifiuta
+                # l'apertura, il device di default viene scelto in automatico
+                params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            self.cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG, params)
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         else:
             self.cap = cv2.VideoCapture(source)
@@ -38,36 +82,136 @@ class VideoSource:
             logger.error(f"Impossibile aprire la sorgente video: {source}")
             return False
 
+        # Chiedi alla sorgente la risoluzione di lavoro: se la rispetta il
+        # resize per frame in read_frame non scatta mai
+        target_w = self.config.frame_width
+        target_h = self.config.frame_height
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, target_w)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, target_h)
+
         # Leggi info video
         fps = self.cap.get(cv2.CAP_PROP_FPS)
         width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         logger.info(f"Video aperto: {width}x{height} @ {fps:.1f} FPS")
+        if self.config.is_rtsp and self.config.rtsp_hw_decode:
+            hw = int(self.cap.get(cv2.CAP_PROP_HW_ACCELERATION))
+            logger.info(f"Decodifica RTSP: {'hardware' if hw else 'CPU'} (hw_acceleration={hw})")
+        if (width, height) != (target_w, target_h):
+            logger.info(f"Resize per frame attivo: {width}x{height} → {target_w}x{target_h}")
+
+        if self.config.is_rtsp:
+            self._start_reader()
         return True
 
+    # -------------------------------------------------------------------
+    # Thread di lettura RTSP
+    # -------------------------------------------------------------------
+
+    def _start_reader(self) -> None:
+        """Avvia il thread che legge lo stream RTSP in background."""
+        with self._frame_cond:
+            self._latest_frame = None
+            self._latest_seq = 0
+            self._read_seq = 0
+            self._reader_failed = False
+        # Evento di stop proprio di ogni thread: un thread precedente ancora
+        # bloccato in cap.read() non deve ripartire con la nuova connessione
+        self._reader_stop = threading.Event()
+        self._reader = threading.Thread(
+            target=self._reader_loop,
+            args=(self.cap, self._reader_stop),
+            name="rtsp-reader",
+            daemon=True,
+        )
+        self._reader.start()
+
+    def _reader_loop(self, cap: cv2.VideoCapture, stop: threading.Event) -> None:
+        """
+        Legge frame finché non viene fermato; conserva solo l'ultimo.
+
+        Il thread possiede la capture e la rilascia all'uscita: nessun altro
+        thread chiama release() mentre questo è dentro cap.read().
+        """
+        try:
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if stop.is_set():
+                    # Fermato durante la lettura: la sorgente è già dismessa
+                    return
+                with self._frame_cond:
+                    if not ret:
+                        # La riconnessione è gestita da read_frame
+                        self._reader_failed = True
+                        self._frame_cond.notify_all()
+                        return
+                    # Il frame precedente, se non ancora letto, viene scartato
+                    self._latest_frame = frame
+                    self._latest_seq += 1
+                    self._frame_cond.notify_all()
+        finally:
+            cap.release()
+
+    def _stop_reader(self) -> None:
+        """Ferma il thread di lettura, che rilascia la propria capture."""
+        if self._reader is None:
+            return
+        self._reader_stop.set()
+        self._reader.join(timeout=READER_JOIN_TIMEOUT)
+        if self._reader.is_alive():
+            logger.warning(
+                "Thread di lettura RTSP ancora bloccato in lettura: "
+                "rilascerà la capture alla sua uscita."
+            )
+        self._reader = None
+
+    def _take_latest(self) -> np.ndarray | None:
+        """
+        Ultimo frame RTSP non ancora consegnato.
+
+        Attende al massimo FRAME_WAIT_TIMEOUT: None se nel frattempo non è
+        arrivato un frame nuovo (o se il thread di lettura ha perso lo
+        stream). Lo stesso frame non viene mai consegnato due volte.
+        """
+        with self._frame_cond:
+            self._frame_cond.wait_for(
+                lambda: self._latest_seq != self._read_seq or self._reader_failed,
+                timeout=FRAME_WAIT_TIMEOUT,
+            )
+            if self._latest_seq == self._read_seq:
+                return None
+            self._read_seq = self._latest_seq
+            frame, self._latest_frame = self._latest_frame, None
+            return frame
+
     def read_frame(self) -> np.ndarray | None:
         """
         Legge un frame dalla sorgente.
         Ritorna il frame (numpy array BGR) o None se non disponibile.
         Per RTSP, tenta la riconnessione automatica in caso di errore.
         """
-        if self.cap is None or not self.cap.isOpened():
-            if self.config.is_rtsp:
-                return self._reconnect()
-            return None
-
-        ret, frame = self.cap.read()
-
-        if not ret:
-            if self.config.is_rtsp:
-                logger.warning("Frame perso su stream RTSP. Riconnessione...")
+        if self.config.is_rtsp:
+            # La capture è del thread di lettura: qui non la si tocca
+            if self._reader is None:
                 return self._reconnect()
-            else:
+            frame = self._take_latest()
+            if frame is None:
+                if self._reader_failed:
+                    logger.warning("Frame perso su stream RTSP. Riconnessione...")
+                    return self._reconnect()
+                return None
+        else:
+            if self.cap is None or not self.cap.isOpened():
+                return None
+            ret, frame = self.cap.read()
+            if not ret:
                 # File terminato
                 logger.info("Fine del file video.")
                 return None
 
-        # Ridimensiona se necessario
+        # Ridimensiona se necessario. Niente buffer di destinazione riusato:
+        # il frame resta in uso nelle code della pipeline e nel display, un
+        # buffer condiviso verrebbe sovrascritto mentre è ancora letto
         h, w = frame.shape[:2]
         target_w = self.config.frame_width
         target_h = self.config.frame_height
@@ -89,6 +233,8 @@ class VideoSource:
 
     def is_open(self) -> bool:
         """True se la sorgente è attiva."""
+        if self.config.is_rtsp:
+            return self._reader is not None
         return self.cap is not None and self.cap.isOpened()
 
     def get_fps(self) -> float:
@@ -99,7 +245,12 @@ class VideoSource:
 
     def release(self) -> None:
         """Rilascia le risorse video."""
-        if self.cap is not None:
+        if self._reader is not None:
+            # RTSP: la capture la rilascia il thread di lettura
+            self._stop_reader()
+            self.cap = None
+            logger.info("Sorgente video rilasciata.")
+        elif self.cap is not None:
             self.cap.release()
             self.cap = None
             logger.info("Sorgente video rilasciata.")
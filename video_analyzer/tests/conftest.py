@@ -0,0 +1,6 @@
+"""Configurazione pytest: i moduli del video analyzer sono in src/ (non è un package installato)."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
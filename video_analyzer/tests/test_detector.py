@@ -0,0 +1,79 @@
+"""
+Test di Detector._track_result: conversione delle righe del tracker in
+Detection, senza modello YOLO (tracker e risultati finti).
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from detector import Detector
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+
+class _FakeBoxes:
+    """Sostituto di ultralytics Boxes già su CPU."""
+
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.cls = np.asarray(cls, dtype=np.float32)
+        self.conf = np.asarray(conf, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self
+
+
+class _FakeTracker:
+    """Tracker che restituisce righe prefissate."""
+
+    def __init__(self, rows, tracked_stracks=()):
+        self.rows = np.asarray(rows, dtype=np.float64).reshape(-1, 8)
+        self.tracked_stracks = list(tracked_stracks)
+
+    def update(self, boxes, frame):
+        return self.rows
+
+
+def _detector() -> Detector:
+    # Nessun __init__: niente caricamento del modello
+    detector = object.__new__(Detector)
+    detector._class_names = ("person", "bicycle", "car", "motorcycle", "airplane", "bus")
+    return detector
+
+
+def test_tracked_boxes_are_clipped_to_frame():
+    # Righe: [x1, y1, x2, y2, track_id, score, cls, idx], box oltre i bordi
+    tracker = _FakeTracker([
+        [1080, 267, 1291, 579, 1, 0.9, 0, 0],
+        [-12, -4, 300, 731.6, 2, 0.8, 5, 1],
+    ])
+    result = SimpleNamespace(boxes=_FakeBoxes([[0, 0, 1, 1]] * 2, [0, 5], [0.9, 0.8]))
+
+    detections = _detector()._track_result(result, FRAME, tracker)
+
+    assert [d.bbox for d in detections] == [(1080, 267, 1280, 579), (0, 0, 300, 720)]
+    for det in detections:
+        x1, y1, x2, y2 = det.bbox
+        assert 0 <= x1 <= x2 <= FRAME.shape[1]
+        assert 0 <= y1 <= y2 <= FRAME.shape[0]
+        assert det.bottom_center == ((x1 + x2) // 2, y2)
+
+
+def test_untracked_boxes_are_returned_without_id():
+    # Nessuna traccia aggiornata (es. tracce nuove non ancora confermate):
+    # le detection grezze restano, con track_id -1
+    tracker = _FakeTracker([], tracked_stracks=[SimpleNamespace(is_activated=False)])
+    result = SimpleNamespace(boxes=_FakeBoxes([[10, 20, 110, 220]], [0], [0.7]))
+
+    detections = _detector()._track_result(result, FRAME, tracker)
+
+    assert len(detections) == 1
+    assert detections[0].track_id == -1
+    assert detections[0].bbox == (10, 20, 110, 220)